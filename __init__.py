@@ -1,48 +1,199 @@
 from os.path import join, dirname
+from threading import Lock, RLock
 
-from json_database import JsonStorage
-
+from ovos_bus_client import Message
+from ovos_utils.log import LOG
 from ovos_utils.ocp import MediaType, PlaybackType
 from ovos_workshop.decorators.ocp import ocp_search, ocp_featured_media
 from ovos_workshop.skills.common_play import OVOSCommonPlaybackSkill
 
+from skill_film_chest_vintage_cartoons.featured import FeaturedMedia
+from skill_film_chest_vintage_cartoons.fuzzy import FuzzyMatcher
+from skill_film_chest_vintage_cartoons.health import StreamHealth
+from skill_film_chest_vintage_cartoons.keywords import dedupe, \
+    extract_keywords, file_hash
+from skill_film_chest_vintage_cartoons.metrics import Metrics
+from skill_film_chest_vintage_cartoons.ranking import find_year, \
+    group_streams
+from skill_film_chest_vintage_cartoons.shards import CatalogShard, ShardSet
+
+try:
+    from ahocorasick_ner import AhocorasickNER
+except ImportError:
+    AhocorasickNER = None  # optional, OCP still matches over the bus
+
+# the bundled catalog, loaded eagerly and used for featured media
+PRIMARY_SHARD = "classic_cartoons"
+PROVIDER_NAMES = ["FilmChestVintageCartoons",
+                  "FilmChest",
+                  "FilmChest Vintage Cartoons",
+                  "FilmChest Cartoons"]
+
 
 class FilmChestVintageCartoonsSkill(OVOSCommonPlaybackSkill):
     def __init__(self, *args, **kwargs):
         self.supported_media = [MediaType.CARTOON]
         self.skill_icon = join(dirname(__file__), "res", "filmchest.gif")
-        path = join(dirname(__file__), "classic_cartoons.json")
-        self.archive = {v["streams"][0]: v for v in JsonStorage(path).values()
-                        if v["streams"]}
+        self.featured = None
+        self.fuzzy = None
+        self.health = None
+        self.metrics = Metrics()
+        self.shards = ShardSet()
+        self._keywords = {}
+        # lowercased keywords registered so far, by label
+        self._registered = {}
+        # shards register keywords from loader threads, the OCP matcher is
+        # rebuilt aside and only swapped in under _keywords_lock, which
+        # searches take around matching
+        self._register_lock = Lock()
+        self._keywords_lock = RLock()
         super().__init__(*args, **kwargs)
+        # compiled catalogs are kept in the skill data dir, the package
+        # dir may not be writable
+        self.load_catalog(join(dirname(__file__), "classic_cartoons.json"))
+        self.metrics.enabled = self.settings.get("metrics", False)
+        self.add_event(f"{self.skill_id}.metrics.get",
+                       self.handle_get_metrics)
+        self.shards.timeout = \
+            self.settings.get("shard_timeout_ms", 1000) / 1000
+        for name, path in self.settings.get("extra_catalogs", {}).items():
+            if name == PRIMARY_SHARD:
+                # it would replace the bundled catalog featured media and
+                # stream checks are served from
+                LOG.error(f"extra catalog {name} skipped, the name is "
+                          f"taken by the bundled catalog")
+                continue
+            self.shards.add(CatalogShard(name, path,
+                                         on_load=self._shard_loaded,
+                                         bin_path=self._bin_path(name)))
+        self.load_ocp_keywords()
+        if self.settings.get("preload_catalogs", False):
+            self.shards.preload()
+        if self.settings.get("check_streams", True):
+            self.health = StreamHealth(
+                join(self.file_system.path, "stream_health.json"),
+                ttl=self.settings.get("stream_check_ttl", 24 * 3600),
+                concurrency=self.settings.get("stream_check_concurrency", 8),
+                on_update=self.featured.invalidate)
+            self.check_streams()
+
+    def _bin_path(self, name):
+        return join(self.file_system.path, f"{name}.bin")
+
+    def load_catalog(self, path):
+        """(re)load the primary catalog, extra shards load on their own"""
+        self.catalog_path = path
+        shard = CatalogShard(PRIMARY_SHARD, path,
+                             bin_path=self._bin_path(PRIMARY_SHARD))
+        shard.load()
+        self._keywords.pop(PRIMARY_SHARD, None)
+        self.archive = shard.archive
+        self.index = shard.index
+        if self.featured is None:
+            self.featured = FeaturedMedia(self.archive, self._featured_entry)
+        else:
+            self.featured.set_archive(self.archive)
+        # the catalog being replaced is released once nothing uses it,
+        # searches and stream checks still running on it keep it open
+        self.shards.add(shard)
+        self.check_streams()
+
+    def check_streams(self):
+        """probe the catalog streams in the background"""
+        if self.health:
+            self.health.start(url for video in self.archive.values()
+                              for url in video["streams"])
+
+    def pick_stream(self, streams):
+        """fastest known good stream in the preferred format if there is
+        one, the first one if unchecked"""
+        preferred_format = self.settings.get("preferred_format")
+        if self.health:
+            return self.health.best_stream(streams, preferred_format)
+        if preferred_format:
+            for url in streams:
+                if url.endswith(preferred_format):
+                    return url
+        return streams[0]
+
+    def stream_for(self, video):
+        return self.pick_stream(video["streams"])
+
+    def _shard_keywords(self, shard):
+        if shard.name not in self._keywords:
+            self._keywords[shard.name] = extract_keywords(
+                shard.archive,
+                join(self.file_system.path, f"ocp_keywords_{shard.name}.json"),
+                file_hash(shard.path))
+        return self._keywords[shard.name]
+
+    def _shard_loaded(self, shard):
+        # make the new titles matchable
         self.load_ocp_keywords()
 
     def load_ocp_keywords(self):
-        titles = []
-
-        for url, data in self.archive.items():
-            t = data["title"].split("|")[0].split("(")[0].strip()
-            titles.append(t.strip())
-            if ":" in t:
-                t1, t2 = t.split(":")
-                titles.append(t1.strip())
-                titles.append(t2.strip())
-            if "-" in t:
-                t1, t2 = t.split("-")
-                titles.append(t1.strip())
-                titles.append(t2.strip())
-
-        self.register_ocp_keyword(MediaType.CARTOON,
-                                  "cartoon_name", titles)
-        self.register_ocp_keyword(MediaType.CARTOON,
-                                  "cartoon_streaming_provider",
-                                  ["FilmChestVintageCartoons",
-                                   "FilmChest",
-                                   "FilmChest Vintage Cartoons",
-                                   "FilmChest Cartoons"])
+        """register the keywords of the loaded shards, only the ones not
+        registered before are added"""
+        with self._register_lock:
+            titles = dedupe(kw for shard in self.shards.loaded()
+                            for kw in self._shard_keywords(shard))
+            self.fuzzy = FuzzyMatcher(titles)
+            self._register_keywords("cartoon_name", titles)
+            self._register_keywords("cartoon_streaming_provider",
+                                    PROVIDER_NAMES)
+
+    def _register_keywords(self, label, samples):
+        """register_ocp_keyword for the samples not registered yet
+
+        register_ocp_keyword adds to what is registered, so every sample
+        is only passed once; the local matcher is rebuilt with the new
+        samples aside and swapped in, searches only wait for the swap
+        """
+        known = self._registered.setdefault(label, set())
+        new = [s for s in samples if s.lower() not in known]
+        if not new:
+            return
+        known.update(s.lower() for s in new)
+
+        matchers = {}
+        if AhocorasickNER is not None:
+            for lang in self.native_langs:
+                matcher = AhocorasickNER()
+                for ent, words in self._ocp_ents.items():
+                    for word in words:
+                        matcher.add_word(ent, word)
+                for word in new:
+                    matcher.add_word(label, word)
+                matcher.fit()
+                matchers[lang] = matcher
+        with self._keywords_lock:
+            self.ocp_matchers.update(matchers)
+            self._ocp_ents.setdefault(label, []).extend(new)
+
+        payload = {"skill_id": self.skill_id,
+                   "label": label,
+                   "media_type": MediaType.CARTOON}
+        if len(new) >= 20:
+            # bus messages with thousands of samples do not work well, OCP
+            # reads them from a file, one per registration since it may
+            # not have read the last one yet
+            csv = join(self.ocp_cache_dir,
+                       f"{self.skill_id}_{label}_{len(known)}.csv")
+            try:
+                with open(csv, "w") as f:
+                    f.write("label,sample")
+                    for word in new:
+                        f.write(f"\n{label},{word}")
+                payload["csv"] = csv
+            except OSError as e:
+                LOG.debug(f"could not export OCP keywords csv: {e}")
+                payload["samples"] = new
+        else:
+            payload["samples"] = new
+        self.bus.emit(Message("ovos.common_play.register_keyword", payload))
 
     def get_playlist(self, score=50, num_entries=25):
-        pl = self.featured_media()[:num_entries]
+        pl = self.featured.page(0, num_entries)
         return {
             "match_confidence": score,
             "media_type": MediaType.MOVIE,
@@ -56,48 +207,116 @@ class FilmChestVintageCartoonsSkill(OVOSCommonPlaybackSkill):
 
     @ocp_search()
     def search_db(self, phrase, media_type):
+        self.metrics.count("queries")
+        # lazy shards start loading with the first query and are searched,
+        # and their titles matchable, once loaded
+        self.shards.preload()
         base_score = 15 if media_type == MediaType.CARTOON else 0
-        entities = self.ocp_voc_match(phrase)
+        with self.metrics.stage("voc_match_ms"), self._keywords_lock:
+            entities = self.ocp_voc_match(phrase)
 
         title = entities.get("cartoon_name")
         skill = "cartoon_streaming_provider" in entities  # skill matched
+        similarity = 1.0
 
-        base_score += 35 * len(entities)
+        if not title and self.fuzzy and self.settings.get("fuzzy_match", True):
+            with self.metrics.stage("fuzzy_match_ms"):
+                matches = self.fuzzy.match(
+                    phrase, limit=1,
+                    max_edits=self.settings.get("fuzzy_max_edits", 2),
+                    timeout=self.settings.get("fuzzy_timeout_ms", 20) / 1000)
+            if matches:
+                title, similarity = matches[0]
+
+        if skill:
+            base_score += 35
 
         if title:
-            candidates = self.archive.values()
-
-            if title:
-                base_score += 35
-                candidates = [video for video in self.archive.values()
-                              if title.lower() in video["title"].lower()]
-
-            for video in candidates:
-                yield {
-                    "title": video["title"],
-                    "match_confidence": min(100, base_score),
-                    "media_type": MediaType.CARTOON,
-                    "uri": video["streams"][0],
-                    "playback": PlaybackType.VIDEO,
-                    "skill_icon": self.skill_icon,
-                    "skill_id": self.skill_id,
-                    "image": video["images"][0] if video["images"] else self.skill_icon
-                }
+            # an exact title match scores 70, fuzzy ones scale down with it
+            base_score += round(70 * similarity)
+            k = self.settings.get("top_k", 0)
+            if k:
+                results = self._search_top_k(phrase, title,
+                                             min(100, base_score), k)
+            else:
+                results = self._search_all(title, min(100, base_score))
+            for result in results:
+                self.metrics.count("results_yielded")
+                yield result
 
         if skill:
-            yield self.get_playlist()
+            with self.metrics.stage("get_playlist_ms"):
+                playlist = self.get_playlist()
+            self.metrics.count("results_yielded")
+            yield playlist
 
-    @ocp_featured_media()
-    def featured_media(self):
-        return [{
+    def _search_all(self, title, score):
+        with self.metrics.stage("filter_ms"):
+            hits = self.shards.search(title)
+        self.metrics.count("candidates_matched", len(hits))
+        for _, shard, key in hits:
+            with self.metrics.stage("build_result_ms"):
+                result = self._search_result(shard.archive[key], score)
+            yield result
+
+    def _search_top_k(self, phrase, title, score, k):
+        with self.metrics.stage("filter_ms"):
+            matched, ranked = self.shards.top_k(
+                title, k, year=find_year(phrase),
+                preferred_format=self.settings.get("preferred_format"),
+                phrase=phrase)
+        self.metrics.count("candidates_matched", matched)
+        threshold = self.settings.get("top_k_min_confidence", 0)
+        for rank_score, videos in ranked:
+            # the best result keeps the full score, the rest trail it
+            conf = round(score * (0.75 + 0.25 * rank_score / ranked[0][0]))
+            if conf < threshold:
+                break  # results only get worse from here
+            with self.metrics.stage("build_result_ms"):
+                streams = group_streams(videos)
+                uri = self.pick_stream(streams)
+                result = self._search_result(videos[0], conf, uri)
+                result["alternate_uris"] = [s for s in streams if s != uri]
+            yield result
+
+    def _search_result(self, video, score, uri=None):
+        return {
+            "title": video["title"],
+            "match_confidence": score,
+            "media_type": MediaType.CARTOON,
+            "uri": uri or self.stream_for(video),
+            "playback": PlaybackType.VIDEO,
+            "skill_icon": self.skill_icon,
+            "skill_id": self.skill_id,
+            "image": video["images"][0] if video["images"] else self.skill_icon
+        }
+
+    def _featured_entry(self, video):
+        return {
             "title": video["title"],
             "match_confidence": 70,
             "media_type": MediaType.MOVIE,
-            "uri": video["streams"][0],
+            "uri": self.stream_for(video),
             "playback": PlaybackType.VIDEO,
             "skill_icon": self.skill_icon,
             "skill_id": self.skill_id
-        } for video in self.archive.values()]
+        }
+
+    @ocp_featured_media()
+    def featured_media(self):
+        with self.metrics.stage("featured_ms"):
+            entries = self.featured.page()
+        self.metrics.count("featured_entries", len(entries))
+        return entries
+
+    def handle_get_metrics(self, message):
+        self.bus.emit(message.response({"metrics": self.metrics.export()}))
+
+    def shutdown(self):
+        if self.health:
+            self.health.stop()
+        self.shards.shutdown()
+        super().shutdown()
 
 
 if __name__ == "__main__":
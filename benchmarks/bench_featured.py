@@ -0,0 +1,66 @@
+"""allocations and latency of get_playlist's featured media slice
+
+before: build every featured entry then keep the first 25
+after:  FeaturedMedia.page(0, 25), cold (first call) and warm
+
+    python benchmarks/bench_featured.py
+"""
+import statistics
+import time
+import tracemalloc
+
+from skill_film_chest_vintage_cartoons.featured import FeaturedMedia
+from synthetic import synthetic_archive
+
+SIZES = [81, 10_000, 100_000]
+NUM_ENTRIES = 25
+
+
+def make_entry(video):
+    return {
+        "title": video["title"],
+        "match_confidence": 70,
+        "media_type": 2,
+        "uri": video["streams"][0],
+        "playback": 1,
+        "skill_icon": "",
+        "skill_id": "bench"
+    }
+
+
+def rebuild(archive):
+    return [make_entry(video) for video in archive.values()][:NUM_ENTRIES]
+
+
+def measure(fn, repeat=10):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, peak / 1024
+
+
+def main():
+    print(f"{'entries':>8} {'variant':>8} {'ms':>9} {'peak KiB':>10}")
+    for n in SIZES:
+        archive = synthetic_archive(n)
+        ms, kib = measure(lambda: rebuild(archive))
+        print(f"{n:>8} {'before':>8} {ms:>9.3f} {kib:>10.1f}")
+
+        start = time.perf_counter()
+        featured = FeaturedMedia(archive, make_entry)
+        featured.page(0, NUM_ENTRIES)
+        cold = (time.perf_counter() - start) * 1000
+        print(f"{n:>8} {'cold':>8} {cold:>9.3f} {'':>10}")
+
+        ms, kib = measure(lambda: featured.page(0, NUM_ENTRIES))
+        print(f"{n:>8} {'warm':>8} {ms:>9.3f} {kib:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
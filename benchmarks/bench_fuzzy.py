@@ -0,0 +1,68 @@
+"""fuzzy matching latency over noisy utterances
+
+utterances are catalog keywords with one or two random character edits,
+wrapped in carrier phrases, the way STT tends to mangle them
+
+    python benchmarks/bench_fuzzy.py
+"""
+import random
+import string
+import time
+
+from skill_film_chest_vintage_cartoons.fuzzy import FuzzyMatcher
+from skill_film_chest_vintage_cartoons.index import normalize
+from skill_film_chest_vintage_cartoons.keywords import build_vocabulary, \
+    title_parts
+from synthetic import synthetic_archive
+
+SIZES = [81, 10_000, 100_000]
+QUERIES = 1000
+CARRIERS = ["play {}", "play {} cartoon", "i want to watch {}", "{}",
+            "put on some {} please"]
+
+
+def mangle(text, rnd):
+    chars = list(text)
+    for _ in range(rnd.randint(1, 2)):
+        pos = rnd.randrange(len(chars))
+        op = rnd.choice("sid")
+        if op == "s":
+            chars[pos] = rnd.choice(string.ascii_lowercase)
+        elif op == "i":
+            chars.insert(pos, rnd.choice(string.ascii_lowercase))
+        elif len(chars) > 1:
+            del chars[pos]
+    return "".join(chars)
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def main():
+    rnd = random.Random(7)
+    print(f"{'entries':>8} {'phrases':>8} {'hit %':>6} {'p50 ms':>7}"
+          f" {'p99 ms':>7} {'max ms':>7}")
+    for n in SIZES:
+        archive = synthetic_archive(n)
+        vocab, _ = build_vocabulary([title_parts(v["title"])
+                                     for v in archive.values()])
+        matcher = FuzzyMatcher(vocab)
+        targets = [p for p in vocab if len(normalize(p)) >= 6]
+        samples = []
+        hits = 0
+        for _ in range(QUERIES):
+            target = rnd.choice(targets)
+            utt = rnd.choice(CARRIERS).format(mangle(target.lower(), rnd))
+            start = time.perf_counter()
+            found = matcher.match(utt, limit=3)
+            samples.append((time.perf_counter() - start) * 1000)
+            hits += any(normalize(p) == normalize(target) for p, _ in found)
+        print(f"{n:>8} {len(vocab):>8} {100 * hits / QUERIES:>6.1f}"
+              f" {percentile(samples, 50):>7.2f}"
+              f" {percentile(samples, 99):>7.2f} {max(samples):>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
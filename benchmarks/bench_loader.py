@@ -0,0 +1,79 @@
+"""startup time and resident memory of the json vs compiled catalog loaders
+
+startup is what the skill does before it can answer: open the catalog and
+get its search index, built in memory for json and read from the file for
+the compiled catalog, then run a first query; each measurement runs in a
+fresh interpreter so RSS is not shared
+
+anon rss is memory private to the process, file rss the pages of the
+compiled catalog mapped in, which are shared with the page cache and can
+be dropped under memory pressure
+
+    python benchmarks/bench_loader.py
+"""
+import json
+import subprocess
+import sys
+import tempfile
+from os.path import join
+
+from skill_film_chest_vintage_cartoons.catalog import compile_catalog
+from synthetic import synthetic_catalog
+
+SIZES = [81, 10_000, 100_000]
+
+PROBE = """
+import json, sys, time
+from skill_film_chest_vintage_cartoons.catalog import (
+    load_json_archive, load_index, CompiledCatalog)
+
+def rss_kb(kind):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(kind + ":"):
+                return int(line.split()[1])
+
+before = rss_kb("RssAnon"), rss_kb("RssFile")
+start = time.perf_counter()
+if sys.argv[1] == "json":
+    archive = load_json_archive(sys.argv[2])
+else:
+    archive = CompiledCatalog(sys.argv[2])
+index = load_index(archive)
+startup = (time.perf_counter() - start) * 1000
+start = time.perf_counter()
+# a query only touches a handful of records
+for key in index.search("betty boop", 25):
+    archive[key]["title"]
+query = (time.perf_counter() - start) * 1000
+print(json.dumps({"startup_ms": startup, "query_ms": query,
+                  "anon_kb": rss_kb("RssAnon") - before[0],
+                  "file_kb": rss_kb("RssFile") - before[1]}))
+"""
+
+
+def probe(kind, path):
+    out = subprocess.check_output([sys.executable, "-c", PROBE, kind, path])
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def main():
+    print(f"{'entries':>8} {'loader':>9} {'startup ms':>11} "
+          f"{'1st query ms':>13} {'anon rss':>9} {'file rss':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in SIZES:
+            src = join(tmp, f"catalog_{n}.json")
+            dst = join(tmp, f"catalog_{n}.bin")
+            catalog = synthetic_catalog(n)
+            with open(src, "w") as f:
+                json.dump(catalog, f)
+            compile_catalog(catalog, dst)
+            for kind, path in (("json", src), ("compiled", dst)):
+                r = probe(kind, path)
+                print(f"{n:>8} {kind:>9} {r['startup_ms']:>11.2f} "
+                      f"{r['query_ms']:>13.2f} {r['anon_kb'] / 1024:>7.1f}MB"
+                      f" {r['file_kb'] / 1024:>7.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
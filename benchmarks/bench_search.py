@@ -0,0 +1,54 @@
+"""compare search_db candidate lookup: linear substring scan vs CatalogIndex
+
+"title" finds the same candidates as the scan (title contains the query),
+"ranked" is the full search, which also matches tags and collections and so
+returns and materializes many more videos
+
+    python benchmarks/bench_search.py
+"""
+import statistics
+import time
+
+from skill_film_chest_vintage_cartoons.index import CatalogIndex
+from synthetic import synthetic_archive
+
+QUERIES = ["betty boop", "popeye", "superman", "mother goose", "frog",
+           "cinderella", "three stooges", "no such cartoon"]
+SIZES = [81, 10_000, 100_000]
+
+
+def linear_scan(archive, title):
+    return [video for video in archive.values()
+            if title.lower() in video["title"].lower()]
+
+
+def timeit(fn, repeat=20):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    print(f"{'entries':>8} {'build ms':>9} {'scan ms':>9} {'title ms':>9}"
+          f" {'speedup':>8} {'ranked ms':>10}")
+    for n in SIZES:
+        archive = synthetic_archive(n)
+        start = time.perf_counter()
+        index = CatalogIndex(archive)
+        build = (time.perf_counter() - start) * 1000
+
+        scan = timeit(lambda: [linear_scan(archive, q) for q in QUERIES])
+        title = timeit(lambda: [[archive[k] for k in index.title_search(q)]
+                                for q in QUERIES])
+        ranked = timeit(lambda: [[archive[k] for k in index.search(q)]
+                                 for q in QUERIES])
+        print(f"{n:>8} {build:>9.1f} {scan / len(QUERIES):>9.3f} "
+              f"{title / len(QUERIES):>9.3f} {scan / title:>7.1f}x "
+              f"{ranked / len(QUERIES):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""end to end OCP search benchmark on the FakeBus
+
+loads synthetic catalogs of increasing size into the skill, runs a fixed
+set of utterances through search_db and featured_media with metrics enabled
+and prints the per stage numbers
+
+    python benchmarks/bench_skill.py
+"""
+import json
+import tempfile
+import time
+from os.path import join
+
+from ovos_utils.messagebus import FakeBus
+from ovos_utils.ocp import MediaType
+
+from skill_film_chest_vintage_cartoons import FilmChestVintageCartoonsSkill
+from synthetic import synthetic_catalog
+
+SIZES = [81, 1_000, 10_000, 100_000]
+UTTERANCES = ["betty boop", "play popeye", "superman cartoons",
+              "betty bop", "popay the sailor", "filmchest cartoons",
+              "play the news"]
+ROUNDS = 20
+
+
+def main():
+    skill = FilmChestVintageCartoonsSkill(bus=FakeBus(), skill_id="t.bench")
+    # no stream probing of synthetic urls
+    if skill.health:
+        skill.health.stop()
+        skill.health = None
+    skill.metrics.enabled = True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in SIZES:
+            path = join(tmp, f"catalog_{n}.json")
+            with open(path, "w") as f:
+                json.dump(synthetic_catalog(n), f)
+            start = time.perf_counter()
+            skill.load_catalog(path)
+            skill.load_ocp_keywords()
+            load = (time.perf_counter() - start) * 1000
+
+            skill.metrics.reset()
+            for _ in range(ROUNDS):
+                for utt in UTTERANCES:
+                    for _ in skill.search_db(utt, MediaType.CARTOON):
+                        pass
+                skill.featured_media()
+
+            report = skill.metrics.export()
+            print(f"\n{n} entries, catalog load {load:.0f}ms")
+            for name, h in sorted(report["histograms"].items()):
+                print(f"  {name:<18} n={h['count']:<6} "
+                      f"mean={h['sum'] / h['count']:.3f} "
+                      f"p50<={h['p50']:.3f} p99<={h['p99']:.3f} "
+                      f"max={h['max']:.3f}")
+            for name, value in sorted(report["counters"].items()):
+                print(f"  {name:<18} {value}")
+    skill.shutdown()
+
+
+if __name__ == "__main__":
+    main()
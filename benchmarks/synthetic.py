@@ -0,0 +1,42 @@
+"""synthetic catalogs for the benchmarks, derived from classic_cartoons.json"""
+import json
+import random
+from os.path import join, dirname
+
+CATALOG = join(dirname(dirname(__file__)), "classic_cartoons.json")
+
+
+def load_catalog():
+    with open(CATALOG) as f:
+        return json.load(f)
+
+
+def synthetic_catalog(n, seed=42):
+    """return an {identifier: entry} dict with n entries
+
+    the real 81 entries come first, the rest are copies with titles and
+    tags made of shuffled words from the real ones and unique stream urls
+    """
+    rnd = random.Random(seed)
+    base = list(load_catalog().items())
+    words = sorted({w for _, e in base for w in e["title"].split()})
+    tags = sorted({w for _, e in base for t in e["tags"] for w in t.split()})
+    catalog = dict(base[:n])
+    i = 0
+    while len(catalog) < n:
+        ident, entry = base[i % len(base)]
+        i += 1
+        new_id = f"{ident}_{i}"
+        title = " ".join(rnd.choice(words) for _ in range(rnd.randint(2, 6)))
+        catalog[new_id] = dict(
+            entry,
+            title=f"{title} {i}",
+            tags=rnd.sample(tags, 3),
+            streams=[s.replace(ident, new_id) for s in entry["streams"]])
+    return catalog
+
+
+def synthetic_archive(n, seed=42):
+    """same as synthetic_catalog but keyed by first stream, like the skill"""
+    return {v["streams"][0]: v for v in synthetic_catalog(n, seed).values()
+            if v["streams"]}
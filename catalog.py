@@ -0,0 +1,428 @@
+"""compiled on-disk catalog
+
+the json catalog is compiled once into a flat binary file:
+
+    header      magic, version, field count, record count, the file
+                length, the size and mtime of the json file it was
+                compiled from and the offsets of the index sections
+    offsets     per record and field a fixed width (offset, length) pair
+                pointing into the string pool
+    keys        record numbers sorted by key (first stream url),
+                used to binary search lookups by key
+    pool        utf-8 strings, list fields joined by SEP
+    titles      normalized title per record, (offset, length) pairs and
+                their own string pool
+    grams, tags, collections
+                the search index postings: term count, per term (term
+                offset, term length, postings offset, postings length)
+                sorted by term, the postings as uint32 record numbers and
+                the terms
+
+the file is opened with mmap, so opening is constant time, records are
+only decoded when they are accessed and the search index is read from the
+file instead of being rebuilt; it is rebuilt when the json file it was
+compiled from changed or its header does not check out
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from os.path import splitext
+
+from json_database import JsonStorage
+from ovos_utils.log import LOG
+
+from skill_film_chest_vintage_cartoons.index import CatalogIndex
+
+MAGIC = b"FCVC"
+VERSION = 4
+SEP = "\x1f"
+FIELDS = ("identifier", "title", "streams", "images", "tags", "collection",
+          "duration", "year", "sizes")
+LIST_FIELDS = {"streams", "images", "tags", "collection", "sizes"}
+INT_FIELDS = {"year", "sizes"}
+
+_HEADER = struct.Struct("<4sHHI")
+_SOURCE = struct.Struct("<QQQ")
+_SECTIONS = struct.Struct("<4Q")
+_SLOT = struct.Struct("<II")
+_IDX = struct.Struct("<I")
+_TERM = struct.Struct("<IIII")
+
+
+def _encode(field, value):
+    if field in LIST_FIELDS:
+        value = SEP.join(str(v) for v in value or [])
+    elif value is None:
+        value = ""
+    return str(value).encode("utf-8")
+
+
+def _ids(values):
+    ids = array("I", values)
+    if sys.byteorder == "big":
+        ids.byteswap()
+    return ids
+
+
+def _string_table(strings):
+    slots = bytearray()
+    pool = bytearray()
+    for text in strings:
+        data = text.encode("utf-8")
+        slots += _SLOT.pack(len(pool), len(data))
+        pool += data
+    return slots + pool
+
+
+def _postings_table(postings):
+    terms = sorted((t.encode("utf-8"), t) for t in postings)
+    entries = bytearray()
+    strings = bytearray()
+    ids = array("I")
+    for data, term in terms:
+        entries += _TERM.pack(len(strings), len(data), len(ids),
+                              len(postings[term]))
+        strings += data
+        ids.extend(postings[term])
+    return _IDX.pack(len(terms)) + entries + _ids(ids).tobytes() + strings
+
+
+def source_id(path):
+    """(size, mtime in ns) of the json file at path, what a compiled
+    catalog is checked against"""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def compile_catalog(entries, path, source=(0, 0)):
+    """write {identifier: entry} to path in the compiled format
+
+    entries without streams are skipped and entries sharing a first stream
+    are collapsed, same as the skill does; the file is written to a
+    temporary name and moved into place
+
+    source: source_id() of the json file entries were read from
+    """
+    by_key = {}
+    for ident, entry in entries.items():
+        if entry.get("streams"):
+            by_key[entry["streams"][0]] = dict(entry, identifier=ident)
+    records = list(by_key.values())
+
+    pool = bytearray()
+    slots = bytearray()
+    index = CatalogIndex()
+    for rec in records:
+        for field in FIELDS:
+            data = _encode(field, rec.get(field))
+            slots += _SLOT.pack(len(pool), len(data))
+            pool += data
+        index.add(rec["streams"][0], rec)
+
+    order = sorted(range(len(records)),
+                   key=lambda i: records[i]["streams"][0].encode("utf-8"))
+    keys = b"".join(_IDX.pack(i) for i in order)
+
+    titles, *postings = index.tables()
+    sections = [_string_table(titles)] + [_postings_table(p)
+                                          for p in postings]
+    offsets = []
+    pos = _HEADER.size + _SOURCE.size + _SECTIONS.size + len(slots) + \
+        len(keys) + len(pool)
+    for section in sections:
+        offsets.append(pos)
+        pos += len(section)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(FIELDS), len(records)))
+        f.write(_SOURCE.pack(pos, *source))
+        f.write(_SECTIONS.pack(*offsets))
+        f.write(slots)
+        f.write(keys)
+        f.write(pool)
+        for section in sections:
+            f.write(section)
+    os.replace(tmp, path)
+
+
+class CatalogRecord(Mapping):
+    """read only view of a single compiled record"""
+    __slots__ = ("_catalog", "_idx")
+
+    def __init__(self, catalog, idx):
+        self._catalog = catalog
+        self._idx = idx
+
+    def __getitem__(self, field):
+        try:
+            pos = FIELDS.index(field)
+        except ValueError:
+            raise KeyError(field)
+        value = self._catalog._field(self._idx, pos)
+        if field in LIST_FIELDS:
+            value = value.split(SEP) if value else []
+            return [int(v) for v in value] if field in INT_FIELDS else value
+        if field in INT_FIELDS:
+            return int(value) if value else None
+        if field == "duration":
+            return value or None
+        return value
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __repr__(self):
+        return f"CatalogRecord({dict(self)!r})"
+
+
+class _Keys(Sequence):
+    """catalog keys by record number"""
+    __slots__ = ("_catalog",)
+
+    def __init__(self, catalog):
+        self._catalog = catalog
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < len(self._catalog):
+            raise IndexError(idx)
+        return self._catalog._key(idx).decode("utf-8")
+
+    def __len__(self):
+        return len(self._catalog)
+
+
+class _Strings(Sequence):
+    """a string table section, decoded on access"""
+    __slots__ = ("_mm", "_slots", "_pool", "_count")
+
+    def __init__(self, mm, offset, count):
+        self._mm = mm
+        self._slots = offset
+        self._pool = offset + count * _SLOT.size
+        self._count = count
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < self._count:
+            raise IndexError(idx)
+        off, size = _SLOT.unpack_from(self._mm, self._slots + idx * _SLOT.size)
+        start = self._pool + off
+        return self._mm[start:start + size].decode("utf-8")
+
+    def __len__(self):
+        return self._count
+
+
+class _Postings:
+    """a postings section, {term: sorted record numbers} looked up in place"""
+    __slots__ = ("_mm", "_terms", "_ids", "_strings", "_count")
+
+    def __init__(self, mm, offset):
+        self._mm = mm
+        self._count = _IDX.unpack_from(mm, offset)[0]
+        self._terms = offset + _IDX.size
+        self._ids = self._terms + self._count * _TERM.size
+        # the terms follow the ids, which end with the last term's postings
+        total = 0
+        if self._count:
+            _, _, start, length = self._term(self._count - 1)
+            total = start + length
+        self._strings = self._ids + total * _IDX.size
+
+    def _term(self, pos):
+        return _TERM.unpack_from(self._mm, self._terms + pos * _TERM.size)
+
+    def get(self, term, default=None):
+        target = term.encode("utf-8")
+        strings = self._strings
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            off, size, start, length = self._term(mid)
+            found = self._mm[strings + off:strings + off + size]
+            if found == target:
+                start = self._ids + start * _IDX.size
+                return _ids(self._mm[start:start + length * _IDX.size])
+            if found < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return default
+
+
+def _read_header(data, size):
+    """return (record count, source_id, section offsets) from the start of
+    a compiled catalog of size bytes, ValueError if it is not a complete
+    one of the current version"""
+    try:
+        magic, version, nfields, count = _HEADER.unpack_from(data, 0)
+        length, *source = _SOURCE.unpack_from(data, _HEADER.size)
+        sections = _SECTIONS.unpack_from(data, _HEADER.size + _SOURCE.size)
+    except struct.error:
+        raise ValueError("truncated header")
+    if magic != MAGIC:
+        raise ValueError("not a compiled catalog")
+    if version != VERSION or nfields != len(FIELDS):
+        raise ValueError(f"compiled catalog version {version}")
+    if length != size or any(off > size for off in sections):
+        raise ValueError(f"compiled catalog is {size} bytes, not {length}")
+    return count, tuple(source), sections
+
+
+class CompiledCatalog(Mapping):
+    """{first stream url: record} mapping backed by a compiled catalog file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"empty compiled catalog: {path}")
+        try:
+            count, self.source, self._sections = _read_header(
+                self._mm, len(self._mm))
+        except ValueError as e:
+            self.close()
+            raise ValueError(f"{e}: {path}")
+        self._count = count
+        self._slots = _HEADER.size + _SOURCE.size + _SECTIONS.size
+        self._keys = self._slots + count * len(FIELDS) * _SLOT.size
+        self._pool = self._keys + count * _IDX.size
+
+    def close(self):
+        self._mm.close()
+
+    def _raw(self, idx, pos):
+        off, size = _SLOT.unpack_from(
+            self._mm, self._slots + (idx * len(FIELDS) + pos) * _SLOT.size)
+        start = self._pool + off
+        return self._mm[start:start + size]
+
+    def _field(self, idx, pos):
+        return self._raw(idx, pos).decode("utf-8")
+
+    def _key(self, idx):
+        streams = self._raw(idx, FIELDS.index("streams"))
+        return streams.split(SEP.encode("utf-8"), 1)[0]
+
+    def record(self, idx):
+        return CatalogRecord(self, idx)
+
+    def index(self):
+        """the CatalogIndex stored in the file, read in place"""
+        titles, grams, tags, collections = self._sections
+        return CatalogIndex.from_tables(
+            _Keys(self), _Strings(self._mm, titles, self._count),
+            _Postings(self._mm, grams), _Postings(self._mm, tags),
+            _Postings(self._mm, collections))
+
+    def __getitem__(self, key):
+        target = key.encode("utf-8")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            idx = _IDX.unpack_from(self._mm, self._keys + mid * _IDX.size)[0]
+            found = self._key(idx)
+            if found == target:
+                return CatalogRecord(self, idx)
+            if found < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        raise KeyError(key)
+
+    def __iter__(self):
+        for idx in range(self._count):
+            yield self._key(idx).decode("utf-8")
+
+    def __len__(self):
+        return self._count
+
+    def items(self):
+        for idx in range(self._count):
+            yield self._key(idx).decode("utf-8"), CatalogRecord(self, idx)
+
+    def values(self):
+        for idx in range(self._count):
+            yield CatalogRecord(self, idx)
+
+
+def compile_json(path, bin_path=None):
+    """compile the json catalog at path, to bin_path or next to it"""
+    # taken before reading, a change while compiling makes it stale
+    source = source_id(path)
+    with open(path) as f:
+        compile_catalog(json.load(f), bin_path or compiled_path(path),
+                        source)
+
+
+def load_json_archive(path):
+    return {v["streams"][0]: v for v in JsonStorage(path).values()
+            if v["streams"]}
+
+
+def compiled_path(path):
+    return splitext(path)[0] + ".bin"
+
+
+def is_compiled(path, bin_path=None):
+    """whether the compiled catalog for the json file at path is current
+
+    it has to be compiled from the json file as it is now, by size and
+    mtime, and have a complete header of the current version
+    """
+    bin_path = bin_path or compiled_path(path)
+    size = _HEADER.size + _SOURCE.size + _SECTIONS.size
+    try:
+        with open(bin_path, "rb") as f:
+            header = f.read(size)
+            _, source, _ = _read_header(header, os.fstat(f.fileno()).st_size)
+        return source == source_id(path)
+    except (OSError, ValueError):
+        return False
+
+
+def load_archive(path, compiled=True, bin_path=None):
+    """load the catalog at path keyed by first stream url
+
+    the compiled catalog at bin_path, by default next to the json file, is
+    used when it is up to date, (re)building it if needed; if it can not be
+    built or read the json file is loaded instead
+    """
+    if not compiled:
+        return load_json_archive(path)
+    bin_path = bin_path or compiled_path(path)
+    try:
+        if is_compiled(path, bin_path):
+            try:
+                return CompiledCatalog(bin_path)
+            except (OSError, ValueError) as e:
+                LOG.info(f"rebuilding compiled catalog: {e}")
+        compile_json(path, bin_path)
+        return CompiledCatalog(bin_path)
+    except (OSError, ValueError, struct.error) as e:
+        LOG.warning(f"compiled catalog unavailable, loading json: {e}")
+        return load_json_archive(path)
+
+
+def load_index(archive):
+    """search index for a load_archive result, a compiled catalog has it
+    stored and only json catalogs are indexed in memory"""
+    if isinstance(archive, CompiledCatalog):
+        return archive.index()
+    return CatalogIndex(archive)
+
+
+if __name__ == "__main__":
+    src = sys.argv[1]
+    dst = sys.argv[2] if len(sys.argv) > 2 else compiled_path(src)
+    compile_json(src, dst)
+    print(f"compiled {src} -> {dst}")
@@ -0,0 +1,55 @@
+from collections.abc import Sequence
+from types import MappingProxyType
+
+from skill_film_chest_vintage_cartoons.catalog import CompiledCatalog
+
+
+class FeaturedMedia(Sequence):
+    """memoized featured media entries for a catalog
+
+    entries are built by make_entry on first access and kept read only until
+    the catalog changes, slices and pages only build what they return
+    """
+
+    def __init__(self, archive, make_entry):
+        self._make_entry = make_entry
+        self.set_archive(archive)
+
+    def set_archive(self, archive):
+        """point the cache at a (new) catalog, dropping every cached entry"""
+        self._archive = archive
+        if isinstance(archive, CompiledCatalog):
+            self._records = archive.record
+        else:
+            self._records = list(archive.values()).__getitem__
+        self._entries = [None] * len(archive)
+
+    def invalidate(self):
+        self.set_archive(self._archive)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry(self, idx):
+        entry = self._entries[idx]
+        if entry is None:
+            entry = MappingProxyType(self._make_entry(self._records(idx)))
+            self._entries[idx] = entry
+        return entry
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._entry(i) for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return self._entry(idx)
+
+    def page(self, offset=0, limit=None):
+        """return entries [offset:offset+limit] as plain dicts
+
+        the dicts are fresh copies, safe to hand to the bus or mutate
+        """
+        stop = len(self) if limit is None else offset + limit
+        return [dict(e) for e in self[offset:stop]]
@@ -0,0 +1,123 @@
+"""typo tolerant keyword matching for STT mistakes ("betty bop", "popay")
+
+known phrases are indexed by padded word trigram, an utterance only gets
+edit distance checks against phrases sharing enough trigrams with it, best
+candidates first, and gives up once the time budget is spent
+"""
+import heapq
+import time
+from collections import Counter
+
+from skill_film_chest_vintage_cartoons.index import normalize
+
+
+def word_trigrams(text):
+    grams = set()
+    for word in text.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def bounded_distance(a, b, max_dist):
+    """levenshtein distance of a and b, or max_dist + 1 if it is larger"""
+    if abs(len(a) - len(b)) > max_dist:
+        return max_dist + 1
+    if len(a) > len(b):
+        a, b = b, a
+    prev = list(range(len(a) + 1))
+    for j, cb in enumerate(b, 1):
+        cur = [j]
+        for i, ca in enumerate(a, 1):
+            cur.append(min(prev[i] + 1, cur[i - 1] + 1,
+                           prev[i - 1] + (ca != cb)))
+        if min(cur) > max_dist:
+            return max_dist + 1
+        prev = cur
+    return prev[-1]
+
+
+class FuzzyMatcher:
+    def __init__(self, phrases, max_edits=2, timeout=0.02, max_candidates=20):
+        """
+        max_edits: edit distance budget, also capped to a third of the
+            phrase length so short phrases need to be closer
+        timeout: hard cap in seconds spent per query
+        max_candidates: most phrases checked by edit distance per query
+        """
+        self.max_edits = max_edits
+        self.timeout = timeout
+        self.max_candidates = max_candidates
+        self.phrases = []
+        self._norm = []
+        self._sizes = []
+        self._grams = {}
+        seen = set()
+        for phrase in phrases:
+            norm = normalize(phrase)
+            if not norm or norm in seen:
+                continue
+            seen.add(norm)
+            idx = len(self.phrases)
+            self.phrases.append(phrase)
+            self._norm.append(norm)
+            grams = word_trigrams(norm)
+            self._sizes.append(len(grams))
+            for gram in grams:
+                self._grams.setdefault(gram, []).append(idx)
+
+    def _candidates(self, utterance, deadline):
+        counts = Counter()
+        grams = sorted((self._grams[g] for g in word_trigrams(utterance)
+                        if g in self._grams), key=len)
+        # grams shared by a large part of the catalog ("the", "pla" from
+        # "play") cost the most to count and tell the least, skip them
+        # once rarer ones found something
+        common = max(1000, len(self.phrases) // 20)
+        for postings in grams:
+            if time.monotonic() > deadline or \
+                    (counts and len(postings) > common):
+                break
+            counts.update(postings)
+        # shortlist by shared grams, then rank by the share of the phrase
+        # found in the utterance
+        shortlist = counts.most_common(self.max_candidates * 10)
+        return heapq.nlargest(self.max_candidates, shortlist,
+                              key=lambda c: c[1] / self._sizes[c[0]])
+
+    def _best_window(self, words, phrase, budget):
+        size = phrase.count(" ") + 1
+        best = budget + 1
+        for n in (size, size - 1, size + 1):
+            if n < 1:
+                continue
+            for start in range(len(words) - n + 1):
+                window = " ".join(words[start:start + n])
+                best = min(best, bounded_distance(window, phrase, budget))
+                if best == 0:
+                    return 0
+        return best
+
+    def match(self, utterance, limit=3, max_edits=None, timeout=None):
+        """return up to limit [(phrase, similarity)], best first
+
+        similarity is 1 - edits / phrase length, an exact match is 1.0
+        """
+        max_edits = self.max_edits if max_edits is None else max_edits
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        utterance = normalize(utterance)
+        words = utterance.split()
+        matches = []
+        for idx, _ in self._candidates(utterance, deadline):
+            if time.monotonic() > deadline:
+                break
+            phrase = self._norm[idx]
+            budget = min(max_edits, len(phrase) // 3)
+            dist = self._best_window(words, phrase, budget)
+            if dist <= budget:
+                matches.append((self.phrases[idx],
+                                1 - dist / len(phrase)))
+        # longer phrases win ties, "betty boop more pep" over "betty boop"
+        matches.sort(key=lambda m: (-m[1], -len(m[0])))
+        return matches[:limit]
@@ -0,0 +1,162 @@
+"""background stream health checks
+
+stream urls are probed with a ranged GET from a pooled requests session,
+driven by asyncio with bounded concurrency in a daemon thread; status and
+time to first byte are kept in an on-disk cache with a ttl, the search path
+only ever reads that cache
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from json_database import JsonStorage
+from ovos_utils.log import LOG
+from requests.adapters import HTTPAdapter
+
+
+class StreamHealth:
+    def __init__(self, path, ttl=24 * 3600, concurrency=8, timeout=10,
+                 on_update=None, batch_size=50):
+        """
+        path: json file caching {url: {"ok", "ttfb", "checked"}}
+        ttl: seconds before a url is probed again
+        concurrency: max probes in flight, also the connection pool size
+        timeout: seconds before a probe counts as failed
+        on_update: called without arguments whenever results are saved
+        batch_size: probes between saves of the cache
+        """
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.on_update = on_update
+        self.batch_size = batch_size
+        self.cache = JsonStorage(path)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._queue = []
+        self._stop = threading.Event()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency,
+                              pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def status(self, url):
+        """return the cached {"ok", "ttfb", "checked"} for url if fresh"""
+        entry = self.cache.get(url)
+        if entry and time.time() - entry["checked"] < self.ttl:
+            return entry
+        return None
+
+    def best_stream(self, streams, preferred_format=None):
+        """pick the fastest known good stream
+
+        unchecked streams keep catalog order and come after known good
+        ones, known bad streams are only used if nothing else is left;
+        within each of those streams ending in preferred_format come first
+        """
+        best, best_rank = streams[0], None
+        for pos, url in enumerate(streams):
+            entry = self.status(url)
+            other = bool(preferred_format) and \
+                not url.endswith(preferred_format)
+            if entry is None:
+                rank = (1, other, pos)
+            elif entry["ok"]:
+                rank = (0, other, entry["ttfb"])
+            else:
+                rank = (2, other, pos)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = url, rank
+        return best
+
+    def probe(self, url):
+        start = time.monotonic()
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout,
+                                  allow_redirects=True,
+                                  headers={"Range": "bytes=0-0"}) as r:
+                ok = r.status_code < 400
+                if ok:
+                    # iter_content turns urllib3 read errors, a stalled
+                    # body timing out, into requests exceptions
+                    next(r.iter_content(1), None)
+            ttfb = time.monotonic() - start
+        except requests.RequestException as e:
+            LOG.debug(f"stream probe failed {url}: {e}")
+            ok, ttfb = False, None
+        return {"ok": ok, "ttfb": ttfb, "checked": time.time()}
+
+    def _save(self):
+        with self._lock:
+            self.cache.store()
+        if self.on_update:
+            self.on_update()
+
+    async def check(self, urls):
+        """probe every url without a fresh cache entry
+
+        results are saved every batch_size probes and once more at the end
+        """
+        pending = [u for u in dict.fromkeys(urls) if self.status(u) is None]
+        if not pending:
+            return
+        loop = asyncio.get_running_loop()
+        sem = asyncio.Semaphore(self.concurrency)
+        done = 0
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            async def run(url):
+                nonlocal done
+                async with sem:
+                    if self._stop.is_set():
+                        return
+                    result = await loop.run_in_executor(pool, self.probe, url)
+                with self._lock:
+                    self.cache[url] = result
+                done += 1
+                if done % self.batch_size == 0:
+                    self._save()
+            # one url failing in an unexpected way must not end the round
+            results = await asyncio.gather(*(run(u) for u in pending),
+                                           return_exceptions=True)
+        for url, result in zip(pending, results):
+            if isinstance(result, Exception):
+                LOG.error(f"stream check failed {url}: {result}")
+        self._save()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                batches, self._queue = self._queue, []
+                if not batches or self._stop.is_set():
+                    self._thread = None
+                    return
+            try:
+                asyncio.run(self.check(u for urls in batches for u in urls))
+            except Exception as e:
+                LOG.error(f"stream checks failed: {e}")
+
+    def start(self, urls):
+        """check urls in a background thread, returns immediately
+
+        urls is consumed in that thread, urls given while a round is
+        running are checked right after it
+        """
+        with self._lock:
+            self._stop.clear()
+            self._queue.append(urls)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                daemon=True)
+                self._thread.start()
+
+    def join(self, timeout=None):
+        """wait for the queued checks to finish"""
+        thread = self._thread
+        if thread:
+            thread.join(timeout)
+
+    def stop(self):
+        self._stop.set()
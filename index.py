@@ -0,0 +1,184 @@
+import re
+from array import array
+from bisect import bisect_left
+from itertools import compress, repeat
+
+_NON_WORD = re.compile(r"[^\w]+|_+")
+
+# relative weight of a hit on each indexed field
+TITLE_WEIGHT = 1.0
+TAGS_WEIGHT = 0.5
+COLLECTION_WEIGHT = 0.25
+
+# postings this many times longer than the candidates are probed by binary
+# search instead of being walked
+PROBE_RATIO = 16
+
+
+def normalize(text):
+    """lowercase text and collapse punctuation / underscores to single spaces"""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def trigrams(text):
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _contains(posting, i):
+    pos = bisect_left(posting, i)
+    return pos < len(posting) and posting[pos] == i
+
+
+def intersect(postings):
+    """return the ids found in every sorted posting list, rarest first"""
+    postings = sorted(postings, key=len)
+    if not postings:
+        return []
+    found = postings[0]
+    for posting in postings[1:]:
+        if not found:
+            break
+        if len(posting) > PROBE_RATIO * len(found):
+            found = [i for i in found if _contains(posting, i)]
+        else:
+            found = set(found).intersection(posting)
+    return found
+
+
+class CatalogIndex:
+    """inverted index over the catalog, built once at load time
+
+    titles are indexed by character trigram so that the substring semantics
+    of the old linear scan are kept ("boop" still matches "Betty Boop's"),
+    tags and collection names are indexed by whole token; postings are
+    sorted arrays of document numbers
+    """
+
+    def __init__(self, archive=None):
+        self.keys = []
+        self._titles = []
+        self._grams = {}
+        self._tags = {}
+        self._collections = {}
+        for key, video in (archive or {}).items():
+            self.add(key, video)
+
+    @classmethod
+    def from_tables(cls, keys, titles, grams, tags, collections):
+        """read only index over prebuilt tables, see tables()
+
+        keys and titles only need indexing and len(), the postings only a
+        get(term) returning a sorted sequence
+        """
+        index = cls.__new__(cls)
+        index.keys = keys
+        index._titles = titles
+        index._grams = grams
+        index._tags = tags
+        index._collections = collections
+        return index
+
+    def tables(self):
+        """return the normalized titles and the grams, tags and collections
+        {term: postings} maps, by document number"""
+        return (self._titles, self._grams, self._tags, self._collections)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, video):
+        idx = len(self.keys)
+        self.keys.append(key)
+        title = normalize(video["title"])
+        self._titles.append(title)
+        for gram in trigrams(title):
+            self._post(self._grams, gram, idx)
+        for tag in video.get("tags") or []:
+            for tok in normalize(tag).split():
+                self._post(self._tags, tok, idx)
+        for col in video.get("collection") or []:
+            for tok in normalize(col).split():
+                self._post(self._collections, tok, idx)
+
+    @staticmethod
+    def _post(postings, key, idx):
+        # documents are added in order, so appending keeps postings sorted
+        posting = postings.get(key)
+        if posting is None:
+            postings[key] = array("I", (idx,))
+        elif posting[-1] != idx:
+            posting.append(idx)
+
+    def normalized_title(self, idx):
+        return self._titles[idx]
+
+    @staticmethod
+    def _intersect(postings, keys):
+        found = []
+        for k in keys:
+            posting = postings.get(k)
+            if not posting:
+                return []
+            found.append(posting)
+        return intersect(found)
+
+    def _title_hits(self, query):
+        if len(query) < 3:
+            # too short for trigrams, rare enough that a scan is fine
+            return {i for i, t in enumerate(self._titles) if query in t}
+        # no edge padding, the query may sit mid-title
+        postings = [self._grams.get(query[i:i + 3])
+                    for i in range(len(query) - 2)]
+        if not all(postings):
+            return []
+        # every hit is in the rarest posting and has to be checked against
+        # its title anyway, doing that right away beats intersecting the
+        # rest of the postings
+        rarest = min(postings, key=len)
+        found = map(str.__contains__, map(self._titles.__getitem__, rarest),
+                    repeat(query))
+        return list(compress(rarest, found))
+
+    def scores(self, query):
+        """return {idx: score} for every document matching query"""
+        query = normalize(query)
+        if not query:
+            return {}
+        toks = query.split()
+        scores = {}
+        for i in self._intersect(self._collections, toks):
+            scores[i] = COLLECTION_WEIGHT
+        for i in self._intersect(self._tags, toks):
+            scores[i] = scores.get(i, 0) + TAGS_WEIGHT
+        for i in self._title_hits(query):
+            # prefer titles the query covers more of
+            coverage = len(query) / max(len(self._titles[i]), 1)
+            scores[i] = scores.get(i, 0) + TITLE_WEIGHT + coverage
+        return scores
+
+    def title_group(self, idx):
+        """return the documents with the same normalized title as idx, in
+        catalog order"""
+        title = self._titles[idx]
+        return sorted(i for i in self._title_hits(title)
+                      if self._titles[i] == title)
+
+    def title_search(self, query):
+        """return catalog keys whose title contains query, in catalog order
+
+        the same candidates the old linear scan found, without ranking
+        """
+        hits = self._title_hits(normalize(query))
+        return [self.keys[i] for i in sorted(hits)]
+
+    def search(self, query, limit=None):
+        """return catalog keys matching query, best match first
+
+        ties keep catalog order
+        """
+        ranked = sorted(self.scores(query).items(),
+                        key=lambda kv: (-kv[1], kv[0]))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [self.keys[i] for i, _ in ranked]
@@ -0,0 +1,118 @@
+"""OCP keyword extraction for the cartoon_name entity
+
+titles are cleaned up and split into their parts ("Betty Boop: More Pep"
+gives "Betty Boop: More Pep", "Betty Boop" and "More Pep"), series names
+are detected from the parts and the vocabulary is deduplicated
+
+results are persisted together with a hash of the catalog, an unchanged
+catalog skips extraction entirely and a changed one only re-processes
+entries whose title changed; the per entry results live in a file of
+their own that is only read when the catalog changed
+"""
+import hashlib
+import re
+from collections import Counter
+from os.path import splitext
+
+from json_database import JsonStorage
+
+# ":" and dashes surrounded by spaces separate parts, "Ker-Choo" is one word
+_PARTS = re.compile(r"\s*:\s*|\s+-+\s+")
+_SPACES = re.compile(r"\s+")
+_STRIP = " .,;!?\"'-"
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def clean(text):
+    return _SPACES.sub(" ", text).strip(_STRIP)
+
+
+def title_parts(title):
+    """return [cleaned title, *parts] for a catalog title"""
+    t = clean(title.split("|")[0].split("(")[0])
+    if not t:
+        return []
+    parts = [t]
+    pieces = [clean(p) for p in _PARTS.split(t)]
+    if len(pieces) > 1:
+        parts += [p for p in pieces if p]
+    return parts
+
+
+def series_names(entries, min_titles=2):
+    """series are leading parts ("Popeye" in "Popeye: Taxi-Turvy") shared
+    by at least min_titles titles, spelled the way most titles do"""
+    forms = {}
+    for parts in entries:
+        if len(parts) > 1:
+            forms.setdefault(parts[1].lower(), Counter())[parts[1]] += 1
+    return [c.most_common(1)[0][0] for c in forms.values()
+            if sum(c.values()) >= min_titles]
+
+
+def dedupe(keywords):
+    seen = set()
+    out = []
+    for kw in keywords:
+        k = kw.lower()
+        if k not in seen:
+            seen.add(k)
+            out.append(kw)
+    return out
+
+
+def build_vocabulary(entries):
+    """return (vocabulary, series) for a list of title_parts results"""
+    series = series_names(entries)
+    return dedupe(series + [p for e in entries for p in e]), series
+
+
+def entries_path(cache_path):
+    """where the per entry results for cache_path are kept"""
+    return splitext(cache_path)[0] + "_entries.json"
+
+
+def extract_keywords(archive, cache_path=None, catalog_hash=None):
+    """return the deduplicated cartoon_name vocabulary for archive
+
+    with cache_path and catalog_hash the result is persisted and reused
+    """
+    cache = entries_cache = None
+    old = {}
+    if cache_path:
+        cache = JsonStorage(cache_path)
+        # caches written before the entries got their own file are redone
+        if catalog_hash and cache.get("catalog_hash") == catalog_hash \
+                and "entries" not in cache:
+            return cache["vocabulary"]
+        entries_cache = JsonStorage(entries_path(cache_path))
+        old = entries_cache.get("entries", {})
+
+    entries = {}
+    for key, video in archive.items():
+        title = video["title"]
+        cached = old.get(key)
+        if cached and cached[0] == title:
+            entries[key] = cached
+        else:
+            entries[key] = [title, title_parts(title)]
+
+    vocabulary, series = build_vocabulary([e[1] for e in entries.values()])
+    if cache is not None:
+        entries_cache.clear()
+        entries_cache["entries"] = entries
+        entries_cache.store()
+        # written last, a crash in between only costs a re-extraction
+        cache.clear()
+        cache["catalog_hash"] = catalog_hash
+        cache["series"] = series
+        cache["vocabulary"] = vocabulary
+        cache.store()
+    return vocabulary
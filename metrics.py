@@ -0,0 +1,91 @@
+"""opt-in timing and counter hooks for the OCP search path
+
+stages are timed into latency histograms (milliseconds) and counters track
+work done, everything is exported as a plain dict; when disabled every hook
+is a no-op
+"""
+import time
+from contextlib import contextmanager, nullcontext
+
+# upper bounds in milliseconds, the last bucket catches everything else
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+           1000, float("inf"))
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """upper bound of the bucket holding the q quantile"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def export(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": {str(b): n for b, n in zip(self.buckets, self.counts)}
+        }
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, value):
+        if self.enabled:
+            self.histograms.setdefault(name, Histogram()).observe(value)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def stage(self, name):
+        """context manager timing the block into the name histogram"""
+        if not self.enabled:
+            return nullcontext()
+        return self._timed(name)
+
+    def export(self):
+        return {
+            "histograms": {k: h.export() for k, h in self.histograms.items()},
+            "counters": dict(self.counters)
+        }
+
+    def reset(self):
+        self.histograms.clear()
+        self.counters.clear()
@@ -0,0 +1,88 @@
+"""top-k ranking of search candidates
+
+candidates sharing a title (re-uploads of the same cartoon) are collapsed
+into a single result, groups are scored on the index score (field and title
+coverage) plus bonuses for how much of the whole utterance the title
+covers, a requested year and the preferred stream format
+
+candidates are taken best index score first into a bounded heap and the
+search stops as soon as no remaining candidate can make it into the top k
+"""
+import heapq
+import re
+
+from skill_film_chest_vintage_cartoons.index import normalize
+
+_YEAR = re.compile(r"(?<!\d)(1[89]\d\d|20\d\d)(?!\d)")
+
+PHRASE_WEIGHT = 1.0
+YEAR_BONUS = 0.5
+FORMAT_BONUS = 0.1
+
+
+def find_year(text):
+    m = _YEAR.search(text)
+    return int(m.group(1)) if m else None
+
+
+def year_of(video):
+    """release year from the synced metadata, the title or the stream url"""
+    return video.get("year") or find_year(video["title"]) or \
+        find_year(video["streams"][0])
+
+
+def top_k(index, archive, scores, k=10, year=None, preferred_format=None,
+          phrase=None):
+    """return up to k [(score, [video, ...])], best first
+
+    scores is the index.scores() result for the query and phrase the whole
+    utterance, each entry returned is a group of videos with the same
+    normalized title, in catalog order; a group is scored on its best
+    candidate
+    """
+    words = set(normalize(phrase).split()) if phrase else set()
+    max_bonus = (PHRASE_WEIGHT if words else 0) + \
+        (YEAR_BONUS if year else 0) + \
+        (FORMAT_BONUS if preferred_format else 0)
+
+    def score(i, title):
+        total = scores[i]
+        if words:
+            total += PHRASE_WEIGHT * len(words.intersection(title.split())) \
+                / len(words)
+        if year or preferred_format:
+            video = archive[index.keys[i]]
+            if year and year_of(video) == year:
+                total += YEAR_BONUS
+            if preferred_format and any(s.endswith(preferred_format)
+                                        for s in video["streams"]):
+                total += FORMAT_BONUS
+        return total
+
+    # best index score first, ties in catalog order
+    queue = [(-s, i) for i, s in scores.items()]
+    heapq.heapify(queue)
+    seen = set()
+    best = []  # (score, -first candidate) of the k best groups, worst first
+    while queue:
+        neg, i = heapq.heappop(queue)
+        if len(best) == k and -neg + max_bonus < best[0][0]:
+            break  # bonuses can not lift anything left into the top k
+        title = index.normalized_title(i)
+        if title in seen:
+            continue  # an upload of a title already ranked on a better one
+        seen.add(title)
+        entry = (score(i, title), -i)
+        if len(best) < k:
+            heapq.heappush(best, entry)
+        else:
+            heapq.heappushpop(best, entry)
+
+    return [(total, [archive[index.keys[j]]
+                     for j in index.title_group(-first) if j in scores])
+            for total, first in sorted(best, reverse=True)]
+
+
+def group_streams(videos):
+    """every stream of a group of videos, in order, without repeats"""
+    return list(dict.fromkeys(s for v in videos for s in v["streams"]))
@@ -0,0 +1,224 @@
+"""several archive collections served by one skill instance
+
+each shard is one catalog file with its own index, loaded in a worker thread
+either at startup or once the first query comes in; queries fan out across
+the loaded shards in a thread pool and the per shard rankings are merged,
+shards still loading are skipped so they never hold up a query
+"""
+import heapq
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from ovos_utils.log import LOG
+
+from skill_film_chest_vintage_cartoons import catalog
+from skill_film_chest_vintage_cartoons.index import normalize
+from skill_film_chest_vintage_cartoons.ranking import top_k
+
+
+class CatalogShard:
+    def __init__(self, name, path, on_load=None, bin_path=None,
+                 compile_timeout=300):
+        """
+        on_load: called with the shard once it finished loading
+        bin_path: where the compiled catalog is kept, next to the json
+            file by default
+        compile_timeout: seconds a background compile may take before the
+            json file is loaded instead
+        """
+        self.name = name
+        self.path = path
+        self.bin_path = bin_path or catalog.compiled_path(path)
+        self.on_load = on_load
+        self.compile_timeout = compile_timeout
+        self.archive = None
+        self.index = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.index is not None
+
+    def _compile_in_child(self):
+        """compile the catalog in a child process, returns if it worked"""
+        try:
+            result = subprocess.run(
+                [sys.executable, "-m", catalog.__name__, self.path,
+                 self.bin_path], capture_output=True,
+                timeout=self.compile_timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            LOG.warning(f"compiling catalog shard {self.name} failed: {e}")
+            return False
+        if result.returncode:
+            err = result.stderr.decode("utf-8", "replace").strip()
+            LOG.warning(f"compiling catalog shard {self.name} failed: "
+                        f"{err.splitlines()[-1] if err else result.returncode}")
+            return False
+        return True
+
+    def load(self, background=False):
+        """load the catalog and its index
+
+        background: loading next to running searches, parsing a big json
+            file holds the GIL for its whole duration so a missing or stale
+            compiled catalog is built in a child process instead
+        """
+        with self._lock:
+            if self.loaded:
+                return
+            compiled = True
+            if background and not catalog.is_compiled(self.path,
+                                                      self.bin_path):
+                # if the child failed compiling in process would too
+                compiled = self._compile_in_child()
+            archive = catalog.load_archive(self.path, compiled,
+                                           self.bin_path)
+            self.archive = archive
+            self.index = catalog.load_index(archive)
+        LOG.debug(f"catalog shard {self.name} loaded: {len(archive)} entries")
+        if self.on_load:
+            self.on_load(self)
+
+    def close(self):
+        """release the compiled catalog, the shard is unusable afterwards"""
+        if hasattr(self.archive, "close"):
+            self.archive.close()
+
+    def search(self, query):
+        """return [(score, shard, key)], best first"""
+        ranked = sorted(self.index.scores(query).items(),
+                        key=lambda kv: (-kv[1], kv[0]))
+        return [(score, self, self.index.keys[i]) for i, score in ranked]
+
+    def top_k(self, query, k, **kwargs):
+        """return (candidates matched, [(score, [video, ...])])"""
+        scores = self.index.scores(query)
+        return len(scores), top_k(self.index, self.archive, scores, k,
+                                  **kwargs)
+
+
+class ShardSet:
+    def __init__(self, workers=4, loaders=1, timeout=1.0, retry_after=60):
+        """
+        workers: shards searched at the same time
+        loaders: shards loaded at the same time, in their own threads so
+            loading never takes a search worker
+        timeout: seconds a query waits for shard searches before skipping
+            the slow ones
+        retry_after: seconds before a shard that failed to load is tried
+            again
+        """
+        self.shards = []
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._loading = {}
+        # the search still running for a shard, a shard that timed out is
+        # skipped until it is done instead of piling up on the pool
+        self._running = {}
+        self._pool = ThreadPoolExecutor(workers,
+                                        thread_name_prefix="catalog-search")
+        self._loader = ThreadPoolExecutor(loaders,
+                                          thread_name_prefix="catalog-load")
+
+    def __iter__(self):
+        return iter(self.shards)
+
+    def add(self, shard):
+        """add shard, replacing a shard with the same name
+
+        the replaced shard is not closed, searches still running on it
+        would fail; its catalog is released once nothing uses it anymore
+        """
+        for i, old in enumerate(self.shards):
+            if old.name == shard.name:
+                self.shards[i] = shard
+                return
+        self.shards.append(shard)
+
+    def loaded(self):
+        return [s for s in self.shards if s.loaded]
+
+    def _load_async(self, shard):
+        """start loading shard in the background, once"""
+        future = self._loading.get(shard.name)
+        if future is None or (
+                future.done() and future.exception() and
+                time.monotonic() - future.submitted > self.retry_after):
+            future = self._loader.submit(shard.load, background=True)
+            future.submitted = time.monotonic()
+            self._loading[shard.name] = future
+        return future
+
+    def preload(self):
+        """load every shard in the background"""
+        for shard in self.shards:
+            if not shard.loaded:
+                self._load_async(shard)
+
+    def fan_out(self, fn):
+        """return [fn(shard)] for every loaded shard answering within the
+        timeout, shards not loaded yet start loading and are skipped until
+        they are ready so they never hold up a query
+
+        a search that timed out can not be stopped once it runs, its shard
+        is skipped until it finished so at most one search per shard ever
+        waits on the pool
+        """
+        shards = []
+        for shard in self.shards:
+            running = self._running.get(shard.name)
+            if not shard.loaded:
+                self._load_async(shard)
+            elif running and not running.done():
+                LOG.warning(f"catalog shard {shard.name} still busy, "
+                            f"skipped")
+            else:
+                shards.append(shard)
+        if len(shards) == 1:
+            return [fn(shards[0])]
+        futures = [self._pool.submit(fn, shard) for shard in shards]
+        for shard, future in zip(shards, futures):
+            self._running[shard.name] = future
+        wait(futures, timeout=self.timeout)
+        results = []
+        for shard, future in zip(shards, futures):
+            if not future.done():
+                future.cancel()  # only works if it did not start yet
+                LOG.warning(f"catalog shard {shard.name} timed out")
+            elif future.exception():
+                LOG.error(f"catalog shard {shard.name} failed: "
+                          f"{future.exception()}")
+            else:
+                results.append(future.result())
+        return results
+
+    def search(self, query):
+        """return [(score, shard, key)] across shards, best first"""
+        return list(heapq.merge(*self.fan_out(lambda s: s.search(query)),
+                                key=lambda r: -r[0]))
+
+    def top_k(self, query, k, **kwargs):
+        """return (candidates matched, best k [(score, [video, ...])])
+
+        a title found in several shards is a single result, scored on its
+        best shard, with the videos from all of them
+        """
+        results = self.fan_out(lambda s: s.top_k(query, k, **kwargs))
+        groups = {}
+        for score, videos in heapq.merge(*(ranked for _, ranked in results),
+                                         key=lambda r: -r[0]):
+            title = normalize(videos[0]["title"])
+            if title in groups:
+                groups[title][1].extend(videos)
+            else:
+                groups[title] = (score, list(videos))
+        return sum(n for n, _ in results), list(groups.values())[:k]
+
+    def shutdown(self):
+        self._loader.shutdown(wait=False, cancel_futures=True)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        for shard in self.shards:
+            shard.close()
@@ -0,0 +1,308 @@
+"""incremental catalog sync from Internet Archive metadata
+
+collection listings come from the scrape api, item metadata from
+/metadata/<identifier>, fetched in parallel batches through a pooled, rate
+limited session; records are diffed against the local catalog by
+identifier and the catalog is only rewritten, atomically, when something
+changed
+
+progress is saved after every batch, fetched records are appended to a log
+next to the sync state and an interrupted sync picks up where it left off
+when run again; every completed sync lists the collections again, items
+that failed are retried by the following syncs until they failed
+max_failures times in a row
+
+    python -m skill_film_chest_vintage_cartoons.sync classic_cartoons \\
+        --catalog classic_cartoons.json
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import dirname, exists
+from urllib.parse import quote
+
+import requests
+from json_database import JsonStorage
+from ovos_utils.log import LOG
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+VIDEO_EXTENSIONS = (".ogv", ".mp4", ".mpeg", ".mpg", ".avi", ".webm", ".mkv")
+_YEAR = re.compile(r"\d{4}")
+
+
+class RateLimiter:
+    """allow at most rate calls per second across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ArchiveClient:
+    def __init__(self, base_url="https://archive.org", rate=10, pool=16,
+                 timeout=30, retries=3):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate)
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.5,
+                      status_forcelist=(429, 500, 502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool,
+                              max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get_json(self, path, **params):
+        self.limiter.wait()
+        r = self.session.get(f"{self.base_url}{path}", params=params,
+                             timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def list_collection(self, collection, page_size=1000):
+        """yield every identifier in collection"""
+        cursor = None
+        while True:
+            params = {"q": f"collection:{collection}",
+                      "fields": "identifier", "count": page_size}
+            if cursor:
+                params["cursor"] = cursor
+            data = self.get_json("/services/search/v1/scrape", **params)
+            for item in data.get("items", []):
+                yield item["identifier"]
+            cursor = data.get("cursor")
+            if not cursor:
+                break
+
+    def metadata(self, identifier):
+        return self.get_json(f"/metadata/{quote(identifier)}")
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _first(value):
+    """IA gives repeated fields as lists, keep the first value"""
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _seconds(length):
+    """file length as given by IA, "415.2" or "06:55", in seconds"""
+    try:
+        secs = 0.0
+        for part in str(length).split(":"):
+            secs = secs * 60 + float(part)
+        return secs
+    except ValueError:
+        return None
+
+
+def record_from_metadata(identifier, data, base_url="https://archive.org"):
+    """catalog entry for an item from its /metadata response"""
+    meta = data.get("metadata", {})
+    files = data.get("files", [])
+    download = f"{base_url.rstrip('/')}/download/{identifier}"
+    videos = [f for f in files
+              if f.get("name", "").lower().endswith(VIDEO_EXTENSIONS)]
+
+    duration = _first(meta.get("runtime"))
+    if not duration:
+        lengths = [s for s in (_seconds(f["length"]) for f in videos
+                               if f.get("length")) if s]
+        if lengths:
+            minutes, seconds = divmod(int(max(lengths)), 60)
+            duration = f"{minutes}:{seconds:02d}"
+
+    year = _first(meta.get("year")) or _first(meta.get("date"))
+    year = _YEAR.match(str(year)) if year else None
+
+    names = {f.get("name") for f in files}
+    return {
+        "collection": _as_list(meta.get("collection")),
+        "tags": _as_list(meta.get("subject")),
+        "streams": [f"{download}/{quote(f['name'])}" for f in videos],
+        "sizes": [int(_first(f.get("size")) or 0) for f in videos],
+        "title": str(_first(meta.get("title")) or identifier),
+        "duration": duration or None,
+        "year": int(year.group()) if year else None,
+        "images": [f"{download}/__ia_thumb.jpg"]
+        if "__ia_thumb.jpg" in names else []
+    }
+
+
+def atomic_write_json(path, data):
+    fd, tmp = tempfile.mkstemp(dir=dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class CatalogSync:
+    def __init__(self, catalog_path, client=None, state_path=None,
+                 workers=8, batch_size=100, max_failures=3):
+        """
+        catalog_path: json catalog {identifier: entry} to update
+        state_path: where progress and failed items are kept between runs,
+            defaults to <catalog_path>.sync, fetched records are logged to
+            <state_path>.records
+        workers: items fetched in parallel
+        batch_size: items fetched between progress saves
+        max_failures: failed syncs in a row after which an item is skipped
+        """
+        self.catalog_path = catalog_path
+        self.client = client or ArchiveClient()
+        state_path = state_path or catalog_path + ".sync"
+        self.state = JsonStorage(state_path)
+        self.records_path = state_path + ".records"
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_failures = max_failures
+
+    def _fetch(self, identifier):
+        try:
+            data = self.client.metadata(identifier)
+            return identifier, record_from_metadata(
+                identifier, data, self.client.base_url)
+        except (requests.RequestException, ValueError, TypeError,
+                KeyError, AttributeError) as e:
+            # odd items are retried by the next sync, never abort this one
+            LOG.error(f"failed to fetch {identifier}: {e}")
+            return identifier, None
+
+    def _load_records(self):
+        records = {}
+        if not exists(self.records_path):
+            return records
+        with open(self.records_path, "rb+") as f:
+            end = 0
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                    ident, record = json.loads(line)
+                except ValueError:
+                    break  # cut short by an interrupted sync
+                records[ident] = record
+                end += len(line)
+            # new records must not be appended to a partial line
+            f.truncate(end)
+        return records
+
+    def run(self, collections):
+        """sync collections into the catalog, returns counts per outcome"""
+        if exists(self.catalog_path):
+            with open(self.catalog_path) as f:
+                catalog = json.load(f)
+        else:
+            catalog = {}
+
+        if self.state.get("collections") != sorted(collections):
+            # new sync, a leftover state from other collections is dropped
+            self.state.clear()
+            self.state["collections"] = sorted(collections)
+            if exists(self.records_path):
+                os.remove(self.records_path)
+        if "pending" not in self.state:
+            ids = {}
+            for col in collections:
+                ids.update(dict.fromkeys(self.client.list_collection(col)))
+            # {identifier: failed syncs in a row}, gone upstream is dropped
+            failures = self.state.get("failures", {})
+            self.state["failures"] = {i: n for i, n in failures.items()
+                                      if i in ids}
+            failures = self.state["failures"]
+            self.state["pending"] = [i for i in ids if failures.get(i, 0) <
+                                     self.max_failures]
+            self.state.store()
+            for ident, n in failures.items():
+                if n >= self.max_failures:
+                    LOG.warning(f"skipping {ident}, failed {n} syncs in a row")
+        failures = self.state["failures"]
+        pending = self.state["pending"]
+
+        # failed items are not recorded, a resumed sync retries them
+        records = self._load_records()
+        todo = [i for i in pending if i not in records]
+        with ThreadPoolExecutor(self.workers) as pool, \
+                open(self.records_path, "a") as log:
+            for start in range(0, len(todo), self.batch_size):
+                batch = todo[start:start + self.batch_size]
+                for ident, record in pool.map(self._fetch, batch):
+                    if record is not None:
+                        records[ident] = record
+                        log.write(json.dumps([ident, record],
+                                             ensure_ascii=False) + "\n")
+                # only the batch is written, never the whole state
+                log.flush()
+
+        failed = [i for i in pending if i not in records]
+        skipped = [i for i, n in failures.items() if n >= self.max_failures]
+        stats = {"added": 0, "updated": 0, "unchanged": 0,
+                 "failed": len(failed), "skipped": len(skipped)}
+        for ident, record in records.items():
+            old = catalog.get(ident)
+            if old == record:
+                stats["unchanged"] += 1
+                continue
+            stats["updated" if old else "added"] += 1
+            catalog[ident] = record
+
+        if stats["added"] or stats["updated"]:
+            atomic_write_json(self.catalog_path, catalog)
+
+        # every pending item was tried, the next sync lists the collections
+        # again and only the failure counts are carried over
+        for ident in pending:
+            if ident in records:
+                failures.pop(ident, None)
+        for ident in failed:
+            failures[ident] = failures.get(ident, 0) + 1
+        os.remove(self.records_path)
+        if failures:
+            del self.state["pending"]
+            self.state.store()
+        else:
+            self.state.clear()
+            self.state.remove()
+        return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("collections", nargs="+")
+    parser.add_argument("--catalog", required=True)
+    parser.add_argument("--base-url", default="https://archive.org")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=10,
+                        help="max requests per second")
+    args = parser.parse_args()
+
+    client = ArchiveClient(args.base_url, rate=args.rate,
+                           pool=args.workers)
+    print(CatalogSync(args.catalog, client, workers=args.workers)
+          .run(args.collections))
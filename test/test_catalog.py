@@ -0,0 +1,192 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import dirname, join
+
+from skill_film_chest_vintage_cartoons import catalog
+from skill_film_chest_vintage_cartoons.catalog import CompiledCatalog, \
+    compile_json, is_compiled, load_archive, load_index, load_json_archive
+from skill_film_chest_vintage_cartoons.index import CatalogIndex
+
+CATALOG = join(dirname(dirname(__file__)), "classic_cartoons.json")
+
+EDGE_CASES = {
+    "unicode": {
+        "title": "Ćevapi & Café: Ärger im Märchenwald — 東京",
+        "streams": ["https://archive.org/download/unicode/Café_東京.ogv"],
+        "images": ["https://archive.org/download/unicode/Café.jpg"],
+        "tags": ["zeichentrick", "café"], "collection": ["märchen"],
+        "duration": "7:12", "year": 1938, "sizes": [1200, 800]},
+    "empty_title": {
+        "title": "", "streams": ["https://archive.org/download/empty/e.ogv"],
+        "images": [], "tags": [], "collection": [], "duration": None},
+    "no_streams": {
+        "title": "Betty Boop: Lost Reel", "streams": [], "images": [],
+        "tags": [], "collection": [], "duration": None},
+    # same first stream as the entry before it, the last one wins
+    "dup_a": {
+        "title": "Popeye: Taxi-Turvy", "images": [], "tags": ["popeye"],
+        "streams": ["https://archive.org/download/dup/dup.ogv"],
+        "collection": ["classic_cartoons"], "duration": None},
+    "dup_b": {
+        "title": "Popeye: Taxi Turvy (1954)", "images": [], "tags": [],
+        "streams": ["https://archive.org/download/dup/dup.ogv",
+                    "https://archive.org/download/dup/dup_512kb.mp4"],
+        "collection": ["classic_cartoons"], "duration": "6:00"},
+}
+
+QUERIES = ["betty boop", "popeye", "taxi turvy", "café", "東京", "märchen",
+           "classic cartoons", "zeichentrick", "boop's", "a", "no such title",
+           ""]
+
+
+class TestCompiledCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        with open(CATALOG) as f:
+            entries = json.load(f)
+        entries.update(EDGE_CASES)
+        self.src = join(self.tmp.name, "catalog.json")
+        self.bin = join(self.tmp.name, "catalog.bin")
+        self.write_json(self.src, entries)
+        self.json = load_json_archive(self.src)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_json(self, path, entries):
+        with open(path, "w") as f:
+            json.dump(entries, f, ensure_ascii=False)
+
+    def compiled(self):
+        archive = load_archive(self.src, bin_path=self.bin)
+        self.assertIsInstance(archive, CompiledCatalog)
+        self.addCleanup(archive.close)
+        return archive
+
+    def test_records(self):
+        archive = self.compiled()
+        self.assertEqual(list(archive), list(self.json))
+        self.assertEqual(len(archive), len(self.json))
+        for key, entry in self.json.items():
+            record = archive[key]
+            for field, value in entry.items():
+                self.assertEqual(record[field], value, (key, field))
+
+    def test_edge_cases(self):
+        archive = self.compiled()
+        unicode = archive["https://archive.org/download/unicode/Café_東京.ogv"]
+        self.assertEqual(unicode["identifier"], "unicode")
+        self.assertEqual(unicode["year"], 1938)
+        self.assertEqual(unicode["sizes"], [1200, 800])
+        self.assertEqual(
+            archive["https://archive.org/download/empty/e.ogv"]["title"], "")
+        self.assertNotIn("Betty Boop: Lost Reel",
+                         [v["title"] for v in archive.values()])
+        dup = archive["https://archive.org/download/dup/dup.ogv"]
+        self.assertEqual(dup["identifier"], "dup_b")
+        self.assertEqual(len(dup["streams"]), 2)
+
+    def test_missing_key(self):
+        archive = self.compiled()
+        for key in ("https://archive.org/download/nope.ogv", "", "￿",
+                    "https://archive.org/download/dup/dup.og"):
+            self.assertNotIn(key, archive)
+            with self.assertRaises(KeyError):
+                archive[key]
+
+    def test_index(self):
+        compiled = load_index(self.compiled())
+        memory = CatalogIndex(self.json)
+        self.assertEqual(list(compiled.keys), memory.keys)
+        for i in range(len(memory)):
+            self.assertEqual(compiled.normalized_title(i),
+                             memory.normalized_title(i))
+            self.assertEqual(compiled.title_group(i), memory.title_group(i))
+        for query in QUERIES:
+            self.assertEqual(compiled.scores(query), memory.scores(query),
+                             query)
+            self.assertEqual(compiled.search(query), memory.search(query),
+                             query)
+            self.assertEqual(compiled.title_search(query),
+                             memory.title_search(query), query)
+
+    def test_postings(self):
+        _, *compiled = load_index(self.compiled()).tables()
+        _, *memory = CatalogIndex(self.json).tables()
+        for stored, postings in zip(compiled, memory):
+            for term, ids in postings.items():
+                self.assertEqual(list(stored.get(term)), list(ids), term)
+            self.assertIsNone(stored.get("no such term"))
+            self.assertIsNone(stored.get(""))
+
+    def test_reused_while_current(self):
+        self.compiled().close()
+        self.assertTrue(is_compiled(self.src, self.bin))
+        mtime = os.stat(self.bin).st_mtime_ns
+        self.compiled()
+        self.assertEqual(os.stat(self.bin).st_mtime_ns, mtime)
+
+    def test_rebuilt_for_other_json(self):
+        self.compiled().close()
+        other = join(self.tmp.name, "other.json")
+        self.write_json(other, {"unicode": EDGE_CASES["unicode"]})
+        self.assertFalse(is_compiled(other, self.bin))
+        archive = load_archive(other, bin_path=self.bin)
+        self.addCleanup(archive.close)
+        self.assertEqual(len(archive), 1)
+
+    def test_rebuilt_for_older_copy(self):
+        self.compiled().close()
+        # a backup restored with its older mtime, cp -p style
+        backup = join(self.tmp.name, "backup.json")
+        self.write_json(backup, {"unicode": EDGE_CASES["unicode"]})
+        os.utime(backup, ns=(1, 1))
+        shutil.copy2(backup, self.src)
+        self.assertFalse(is_compiled(self.src, self.bin))
+        archive = self.compiled()
+        self.assertEqual(len(archive), 1)
+
+    def assert_rebuilt(self):
+        self.assertFalse(is_compiled(self.src, self.bin))
+        archive = self.compiled()
+        self.assertEqual(len(archive), len(self.json))
+        archive.close()
+        self.assertTrue(is_compiled(self.src, self.bin))
+
+    def test_old_version_rebuilt(self):
+        compile_json(self.src, self.bin)
+        with open(self.bin, "r+b") as f:
+            f.seek(4)
+            f.write((catalog.VERSION - 1).to_bytes(2, "little"))
+        with self.assertRaises(ValueError):
+            CompiledCatalog(self.bin)
+        self.assert_rebuilt()
+
+    def test_truncated_rebuilt(self):
+        compile_json(self.src, self.bin)
+        size = os.path.getsize(self.bin)
+        for length in (size - 1, 30, 3, 0):
+            with open(self.bin, "r+b") as f:
+                f.truncate(length)
+            with self.assertRaises(ValueError):
+                CompiledCatalog(self.bin)
+            self.assert_rebuilt()
+
+    def test_garbage_rebuilt(self):
+        with open(self.bin, "wb") as f:
+            f.write(b"not a catalog" * 100)
+        self.assert_rebuilt()
+
+    def test_json_fallback(self):
+        # the compiled catalog can not be written, the json is served
+        archive = load_archive(self.src,
+                               bin_path=join(self.tmp.name, "no", "c.bin"))
+        self.assertEqual(archive, self.json)
+        self.assertIsInstance(load_index(archive), CatalogIndex)
+
+
+if __name__ == "__main__":
+    unittest.main()
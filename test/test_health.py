@@ -0,0 +1,125 @@
+import asyncio
+import json
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import join
+
+from skill_film_chest_vintage_cartoons.health import StreamHealth
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/missing.ogv":
+            self.send_error(404)
+            return
+        self.send_response(206)
+        self.send_header("Content-Length", "1")
+        self.end_headers()
+        if self.path == "/slow.ogv":
+            # headers go out right away, the body stalls past the timeout
+            self.wfile.flush()
+            time.sleep(2)
+        self.wfile.write(b"x")
+
+    def log_message(self, *args):
+        pass
+
+
+def refused_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}/refused.ogv"
+
+
+class TestStreamHealth(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StreamHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{cls.server.server_port}"
+        cls.fast = f"{base}/fast.ogv"
+        cls.slow = f"{base}/slow.ogv"
+        cls.missing = f"{base}/missing.ogv"
+        cls.refused = refused_url()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = join(self.tmp.name, "stream_health.json")
+        self.updates = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def on_update(self):
+        self.updates += 1
+
+    def make(self, **kwargs):
+        return StreamHealth(self.path, timeout=0.5, on_update=self.on_update,
+                            **kwargs)
+
+    def test_check(self):
+        health = self.make()
+        asyncio.run(health.check([self.fast, self.slow, self.missing,
+                                  self.refused]))
+        self.assertTrue(health.status(self.fast)["ok"])
+        self.assertIsNotNone(health.status(self.fast)["ttfb"])
+        for url in (self.slow, self.missing, self.refused):
+            self.assertFalse(health.status(url)["ok"], url)
+        for url in (self.slow, self.refused):
+            self.assertIsNone(health.status(url)["ttfb"], url)
+        self.assertEqual(self.updates, 1)
+        with open(self.path) as f:
+            self.assertEqual(len(json.load(f)), 4)
+
+    def test_saved_in_batches(self):
+        health = self.make(batch_size=1)
+        asyncio.run(health.check([self.fast, self.missing]))
+        # once per probe and once at the end of the round
+        self.assertEqual(self.updates, 3)
+
+    def test_best_stream(self):
+        health = self.make()
+        streams = [self.refused, self.missing, self.fast]
+        self.assertEqual(health.best_stream(streams), self.refused)
+        asyncio.run(health.check(streams))
+        self.assertEqual(health.best_stream(streams), self.fast)
+        # unchecked streams rank after known good and before known bad
+        unchecked = self.fast + "?unchecked"
+        self.assertEqual(health.best_stream([self.refused, unchecked]),
+                         unchecked)
+
+    def test_ttl(self):
+        health = self.make(ttl=0)
+        asyncio.run(health.check([self.fast]))
+        self.assertIsNone(health.status(self.fast))
+
+    def test_start_queues_urls(self):
+        health = self.make()
+        health.start([self.slow])
+        # given while the first round is still running
+        health.start(iter([self.fast, self.missing]))
+        health.join(10)
+        for url in (self.slow, self.fast, self.missing):
+            self.assertIsNotNone(health.status(url), url)
+        self.assertTrue(health.status(self.fast)["ok"])
+
+    def test_stop(self):
+        health = self.make(concurrency=1)
+        health.stop()
+        asyncio.run(health.check([self.fast]))
+        self.assertIsNone(health.status(self.fast))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import json
+import random
+import unittest
+from os.path import dirname, join
+
+from skill_film_chest_vintage_cartoons.index import CatalogIndex, normalize
+from skill_film_chest_vintage_cartoons.ranking import FORMAT_BONUS, \
+    PHRASE_WEIGHT, YEAR_BONUS, find_year, group_streams, top_k, year_of
+
+CATALOG = join(dirname(dirname(__file__)), "classic_cartoons.json")
+
+
+def load_archive():
+    with open(CATALOG) as f:
+        entries = json.load(f)
+    return {v["streams"][0]: v for v in entries.values() if v["streams"]}
+
+
+def synthetic_archive(n, seed=7):
+    """the real catalog plus re-uploads and new titles with years and
+    formats spread over them"""
+    rnd = random.Random(seed)
+    base = list(load_archive().values())
+    words = sorted({w for v in base for w in v["title"].split()})
+    archive = {}
+    for i in range(n):
+        video = base[i % len(base)]
+        if rnd.random() < 0.3:
+            title = video["title"]  # a re-upload
+        else:
+            title = " ".join(rnd.choice(words)
+                             for _ in range(rnd.randint(2, 5)))
+        fmt = rnd.choice(["ogv", "mp4", "mpeg"])
+        stream = f"https://archive.org/download/item_{i}/item_{i}.{fmt}"
+        archive[stream] = dict(video, title=title, streams=[stream],
+                               year=rnd.choice([None, 1933, 1936, 1939]))
+    return archive
+
+
+def exhaustive(index, archive, scores, k, year=None, preferred_format=None,
+               phrase=None):
+    """every candidate scored, grouped by title on its best one"""
+    words = set(normalize(phrase).split()) if phrase else set()
+    groups = {}
+    for i in sorted(scores, key=lambda i: (-scores[i], i)):
+        title = index.normalized_title(i)
+        if title in groups:
+            groups[title][2].append(i)
+            continue
+        video = archive[index.keys[i]]
+        total = scores[i]
+        if words:
+            total += PHRASE_WEIGHT * len(words & set(title.split())) / \
+                len(words)
+        if year and year_of(video) == year:
+            total += YEAR_BONUS
+        if preferred_format and any(s.endswith(preferred_format)
+                                    for s in video["streams"]):
+            total += FORMAT_BONUS
+        groups[title] = (total, i, [i])
+    ranked = sorted(groups.values(), key=lambda g: (-g[0], g[1]))[:k]
+    return [(total, [archive[index.keys[j]] for j in sorted(members)])
+            for total, _, members in ranked]
+
+
+class TestTopK(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.archive = synthetic_archive(3000)
+        cls.index = CatalogIndex(cls.archive)
+
+    def test_matches_exhaustive_ranking(self):
+        queries = ["betty boop", "popeye", "boop", "song a day", "superman",
+                   "cartoons", "the"]
+        options = [{}, {"year": 1936}, {"preferred_format": "mp4"},
+                   {"year": 1933, "preferred_format": "ogv"},
+                   {"phrase": "play the betty boop song a day from 1936",
+                    "year": 1936, "preferred_format": "mpeg"}]
+        for query in queries:
+            scores = self.index.scores(query)
+            self.assertTrue(scores, query)
+            for kwargs in options:
+                for k in (1, 3, 10, 50):
+                    self.assertEqual(
+                        top_k(self.index, self.archive, scores, k, **kwargs),
+                        exhaustive(self.index, self.archive, scores, k,
+                                   **kwargs),
+                        (query, kwargs, k))
+
+    def test_bonus_lifts_past_early_stop(self):
+        # a weak index match with every bonus beats a stronger one without
+        scores = {0: 1.0, 1: 1.2, 2: 1.5}
+        archive = {}
+        for i in range(3):
+            stream = f"https://archive.org/download/item_{i}/item_{i}." + \
+                ("mp4" if i == 0 else "ogv")
+            archive[stream] = {"title": f"title {i}", "streams": [stream],
+                               "year": 1936 if i == 0 else None}
+        index = CatalogIndex(archive)
+        ranked = top_k(index, archive, scores, 1, year=1936,
+                       preferred_format="mp4")
+        self.assertEqual(len(ranked), 1)
+        self.assertEqual(ranked[0][1][0]["title"], "title 0")
+        self.assertAlmostEqual(ranked[0][0], 1.0 + YEAR_BONUS + FORMAT_BONUS)
+
+    def test_collapses_reuploads(self):
+        archive = load_archive()
+        index = CatalogIndex(archive)
+        phrase = "play betty boop song a day"
+        ranked = top_k(index, archive, index.scores("betty boop"), 5,
+                       year=find_year(phrase), phrase=phrase)
+        titles = [videos[0]["title"] for _, videos in ranked]
+        self.assertEqual(titles[0], "Betty Boop: A Song A Day")
+        self.assertEqual(len(set(map(normalize, titles))), len(titles))
+
+        videos = ranked[0][1]
+        self.assertEqual([v["streams"][0] for v in videos], [
+            "https://archive.org/download/Betty_Boop_A_Song_A_Day_1936_457/"
+            "Betty_Boop_A_Song_a_Day_1936.ogv",
+            "https://archive.org/download/Betty_Boop_A_Song_a_Day_1936/"
+            "Betty_Boop_A_Song_a_Day_1936.ogv"])
+        # what the skill plays, the rest are its alternate_uris
+        streams = group_streams(videos)
+        self.assertEqual(len(streams), 4)
+        self.assertEqual(streams[:2], videos[0]["streams"])
+
+    def test_title_group(self):
+        archive = load_archive()
+        index = CatalogIndex(archive)
+        titles = [index.normalized_title(i) for i in range(len(index))]
+        for i, title in enumerate(titles):
+            self.assertEqual(index.title_group(i),
+                             [j for j, t in enumerate(titles) if t == title])
+
+
+if __name__ == "__main__":
+    unittest.main()
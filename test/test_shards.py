@@ -0,0 +1,157 @@
+import threading
+import time
+import unittest
+
+from skill_film_chest_vintage_cartoons.shards import ShardSet
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+class StubShard:
+    """a shard answering with fixed results, optionally blocking until
+    released or failing to load"""
+
+    def __init__(self, name, ranked=(), loaded=True, load_failures=0,
+                 block=False):
+        self.name = name
+        self.ranked = list(ranked)
+        self.loaded = loaded
+        self.load_failures = load_failures
+        self.loads = 0
+        self.searches = 0
+        self.closed = False
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def load(self, background=False):
+        self.loads += 1
+        if self.loads <= self.load_failures:
+            raise OSError("catalog missing")
+        self.loaded = True
+
+    def close(self):
+        self.closed = True
+
+    def search(self, query):
+        self.searches += 1
+        self.release.wait()
+        return [(score, self, videos[0]["streams"][0])
+                for score, videos in self.ranked]
+
+    def top_k(self, query, k, **kwargs):
+        self.searches += 1
+        self.release.wait()
+        return len(self.ranked), self.ranked[:k]
+
+
+def video(title, stream):
+    return {"title": title, "streams": [stream]}
+
+
+class TestShardSet(unittest.TestCase):
+    def setUp(self):
+        self.shards = ShardSet(timeout=0.2)
+
+    def tearDown(self):
+        for shard in self.shards:
+            shard.release.set()
+        self.shards.shutdown()
+
+    def test_search_merges_by_score(self):
+        self.shards.add(StubShard("a", [(3, [video("A1", "a1")]),
+                                        (1, [video("A2", "a2")])]))
+        self.shards.add(StubShard("b", [(2, [video("B1", "b1")])]))
+        hits = self.shards.search("cartoon")
+        self.assertEqual([(score, key) for score, _, key in hits],
+                         [(3, "a1"), (2, "b1"), (1, "a2")])
+
+    def test_timeout_skips_slow_shard(self):
+        fast = StubShard("fast", [(1, [video("Fast", "fast")])])
+        slow = StubShard("slow", [(2, [video("Slow", "slow")])], block=True)
+        self.shards.add(fast)
+        self.shards.add(slow)
+        start = time.monotonic()
+        hits = self.shards.search("cartoon")
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual([key for _, _, key in hits], ["fast"])
+
+    def test_busy_shard_skipped_until_done(self):
+        fast = StubShard("fast", [(1, [video("Fast", "fast")])])
+        slow = StubShard("slow", [(2, [video("Slow", "slow")])], block=True)
+        self.shards.add(fast)
+        self.shards.add(slow)
+        self.shards.search("cartoon")  # times out on slow
+        hits = self.shards.search("cartoon")
+        self.assertEqual([key for _, _, key in hits], ["fast"])
+        # the timed out search still runs, no second one was queued
+        self.assertEqual(slow.searches, 1)
+        self.assertEqual(fast.searches, 2)
+
+        slow.release.set()
+        wait_for(lambda: self.shards._running["slow"].done())
+        hits = self.shards.search("cartoon")
+        self.assertEqual([key for _, _, key in hits], ["slow", "fast"])
+        self.assertEqual(slow.searches, 2)
+
+    def test_unloaded_shard_loads_in_background(self):
+        shard = StubShard("lazy", [(1, [video("Lazy", "lazy")])],
+                          loaded=False)
+        self.shards.add(shard)
+        self.assertEqual(self.shards.search("cartoon"), [])
+        wait_for(lambda: shard.loaded)
+        hits = self.shards.search("cartoon")
+        self.assertEqual([key for _, _, key in hits], ["lazy"])
+        self.assertEqual(shard.loads, 1)
+
+    def test_failed_load_retried_after_delay(self):
+        self.shards.retry_after = 0.3
+        shard = StubShard("broken", loaded=False, load_failures=1)
+        self.shards.add(shard)
+        self.shards.preload()
+        wait_for(lambda: self.shards._loading["broken"].done())
+        # a query right after the failure does not try again
+        self.shards.search("cartoon")
+        self.assertEqual(shard.loads, 1)
+
+        time.sleep(0.3)
+        self.shards.search("cartoon")
+        wait_for(lambda: shard.loaded)
+        self.assertEqual(shard.loads, 2)
+
+    def test_top_k_collapses_title_across_shards(self):
+        self.shards.add(StubShard("a", [
+            (3, [video("Betty Boop: More Pep", "a1")]),
+            (1, [video("Popeye", "a2")])]))
+        self.shards.add(StubShard("b", [
+            (2, [video("betty boop - more pep", "b1"),
+                 video("Betty Boop More Pep", "b2")]),
+            (1.5, [video("Superman", "b3")])]))
+        matched, ranked = self.shards.top_k("more pep", 2)
+        self.assertEqual(matched, 4)
+        self.assertEqual(len(ranked), 2)
+        score, videos = ranked[0]
+        self.assertEqual(score, 3)
+        self.assertEqual([v["streams"][0] for v in videos],
+                         ["a1", "b1", "b2"])
+        self.assertEqual(ranked[1][0], 1.5)
+
+    def test_add_replaces_without_closing(self):
+        old = StubShard("a")
+        new = StubShard("a")
+        self.shards.add(old)
+        self.shards.add(new)
+        self.assertEqual(list(self.shards), [new])
+        self.assertFalse(old.closed)
+        self.shards.shutdown()
+        self.assertTrue(new.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import dirname, exists, join
+from urllib.parse import parse_qs, unquote, urlparse
+
+from skill_film_chest_vintage_cartoons.sync import ArchiveClient, \
+    CatalogSync, record_from_metadata
+
+FIXTURES = join(dirname(__file__), "fixtures", "sync")
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """serves the recorded responses in FIXTURES like archive.org would"""
+    requests = Counter()
+    # {collection: fixture}, a collection that changed upstream
+    listings = {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.requests[url.path] += 1
+        if url.path == "/services/search/v1/scrape":
+            params = parse_qs(url.query)
+            collection = params["q"][0].split(":", 1)[1]
+            name = params.get("cursor",
+                              [self.listings.get(collection, collection)])[0]
+            path = join(FIXTURES, f"scrape_{name}.json")
+        elif url.path.startswith("/metadata/"):
+            ident = unquote(url.path[len("/metadata/"):])
+            path = join(FIXTURES, "metadata", f"{ident}.json")
+        else:
+            path = None
+        if not path or not exists(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Killed(BaseException):
+    pass
+
+
+class KilledClient(ArchiveClient):
+    """a sync killed once the first batch is done"""
+
+    def metadata(self, identifier):
+        if identifier == "superman_eleventh_hour":
+            raise Killed()
+        return super().metadata(identifier)
+
+
+def load_fixture(ident):
+    with open(join(FIXTURES, "metadata", f"{ident}.json")) as f:
+        return json.load(f)
+
+
+class TestRecordFromMetadata(unittest.TestCase):
+    def test_record(self):
+        record = record_from_metadata(
+            "superman_eleventh_hour", load_fixture("superman_eleventh_hour"))
+        base = "https://archive.org/download/superman_eleventh_hour"
+        self.assertEqual(record, {
+            "collection": ["classic_cartoons"],
+            "tags": ["Superman", "Fleischer"],
+            "streams": [f"{base}/superman_eleventh_hour.mpeg",
+                        f"{base}/superman_eleventh_hour_512kb.mp4"],
+            "sizes": [140509184, 36700160],
+            "title": "Superman: Eleventh Hour",
+            "duration": "9:12",
+            "year": 1942,
+            "images": [f"{base}/__ia_thumb.jpg"]
+        })
+
+    def test_list_fields(self):
+        record = record_from_metadata(
+            "Betty_Boop_More_Pep_1936",
+            load_fixture("Betty_Boop_More_Pep_1936"))
+        self.assertEqual(record["title"], "Betty Boop: More Pep")
+        self.assertEqual(record["year"], 1936)
+        record = record_from_metadata(
+            "popeye_taxi-turvey", load_fixture("popeye_taxi-turvey"))
+        self.assertEqual(record["duration"], "6:52")
+        self.assertEqual(record["year"], 1954)
+        self.assertEqual(record["collection"], ["classic_cartoons"])
+
+
+class TestCatalogSync(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        ArchiveHandler.requests.clear()
+        ArchiveHandler.listings.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.catalog = join(self.tmp.name, "catalog.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def sync(self, collection, **kwargs):
+        client = ArchiveClient(self.base_url, rate=0, pool=2, retries=0)
+        return CatalogSync(self.catalog, client, workers=2, batch_size=2,
+                           **kwargs).run([collection])
+
+    def read_catalog(self):
+        with open(self.catalog) as f:
+            return json.load(f)
+
+    def test_sync(self):
+        stats = self.sync("good_cartoons")
+        self.assertEqual(stats, {"added": 3, "updated": 0, "unchanged": 0,
+                                 "failed": 0, "skipped": 0})
+        catalog = self.read_catalog()
+        self.assertEqual(sorted(catalog), ["Betty_Boop_More_Pep_1936",
+                                           "popeye_taxi-turvey",
+                                           "superman_eleventh_hour"])
+        betty = catalog["Betty_Boop_More_Pep_1936"]
+        self.assertEqual(betty["title"], "Betty Boop: More Pep")
+        self.assertEqual(betty["duration"], "6:55")
+        self.assertTrue(betty["streams"][0].startswith(self.base_url))
+        # a complete sync leaves no state behind
+        self.assertEqual(os.listdir(self.tmp.name), ["catalog.json"])
+
+    def test_unchanged(self):
+        self.sync("good_cartoons")
+        mtime = os.stat(self.catalog).st_mtime_ns
+        stats = self.sync("good_cartoons")
+        self.assertEqual(stats, {"added": 0, "updated": 0, "unchanged": 3,
+                                 "failed": 0, "skipped": 0})
+        self.assertEqual(os.stat(self.catalog).st_mtime_ns, mtime)
+
+    def test_updated(self):
+        self.sync("good_cartoons")
+        catalog = self.read_catalog()
+        catalog["popeye_taxi-turvey"]["title"] = "Popeye"
+        catalog["removed_upstream"] = {"title": "kept", "streams": []}
+        with open(self.catalog, "w") as f:
+            json.dump(catalog, f)
+        stats = self.sync("good_cartoons")
+        self.assertEqual(stats, {"added": 0, "updated": 1, "unchanged": 2,
+                                 "failed": 0, "skipped": 0})
+        catalog = self.read_catalog()
+        self.assertEqual(catalog["popeye_taxi-turvey"]["title"],
+                         "Popeye: Taxi-Turvy")
+        self.assertIn("removed_upstream", catalog)
+
+    def test_failures_retried(self):
+        # odd_item has malformed metadata, missing_item is a 404
+        stats = self.sync("classic_cartoons")
+        self.assertEqual(stats, {"added": 3, "updated": 0, "unchanged": 0,
+                                 "failed": 2, "skipped": 0})
+        self.assertEqual(len(self.read_catalog()), 3)
+        with open(self.catalog + ".sync") as f:
+            state = json.load(f)
+        self.assertEqual(state["failures"], {"odd_item": 1,
+                                             "missing_item": 1})
+        self.assertNotIn("pending", state)
+        self.assertFalse(exists(self.catalog + ".sync.records"))
+
+        # the next run lists the collection again and retries them
+        ArchiveHandler.requests.clear()
+        stats = self.sync("classic_cartoons")
+        self.assertEqual(stats, {"added": 0, "updated": 0, "unchanged": 3,
+                                 "failed": 2, "skipped": 0})
+        self.assertEqual(
+            ArchiveHandler.requests["/services/search/v1/scrape"], 2)
+        self.assertEqual(ArchiveHandler.requests["/metadata/odd_item"], 1)
+
+    def test_new_items_after_failures(self):
+        self.sync("classic_cartoons")
+        # a new upload shows up in the collection
+        ArchiveHandler.listings["classic_cartoons"] = "classic_cartoons_new"
+        stats = self.sync("classic_cartoons")
+        self.assertEqual(stats, {"added": 1, "updated": 0, "unchanged": 3,
+                                 "failed": 2, "skipped": 0})
+        self.assertEqual(self.read_catalog()["Betty_Boop_A_Song_a_Day_1936"]
+                         ["title"], "Betty Boop: A Song A Day")
+
+    def test_failure_cap(self):
+        for _ in range(2):
+            self.sync("classic_cartoons", max_failures=2)
+        ArchiveHandler.requests.clear()
+        stats = self.sync("classic_cartoons", max_failures=2)
+        self.assertEqual(stats, {"added": 0, "updated": 0, "unchanged": 3,
+                                 "failed": 0, "skipped": 2})
+        self.assertNotIn("/metadata/odd_item", ArchiveHandler.requests)
+        self.assertNotIn("/metadata/missing_item", ArchiveHandler.requests)
+        # gone upstream, its failure count goes with it
+        ArchiveHandler.listings["classic_cartoons"] = "good_cartoons"
+        stats = self.sync("classic_cartoons", max_failures=2)
+        self.assertEqual(stats["skipped"], 0)
+        self.assertEqual(os.listdir(self.tmp.name), ["catalog.json"])
+
+    def test_interrupted_log(self):
+        client = KilledClient(self.base_url, rate=0, pool=2, retries=0)
+        with self.assertRaises(Killed):
+            CatalogSync(self.catalog, client, workers=2,
+                        batch_size=2).run(["classic_cartoons"])
+        # killed while writing, the log ends in a partial line
+        with open(self.catalog + ".sync.records", "a") as f:
+            f.write('["superman_eleventh_hour", {"title"')
+        ArchiveHandler.requests.clear()
+        stats = self.sync("classic_cartoons")
+        self.assertEqual(stats, {"added": 3, "updated": 0, "unchanged": 0,
+                                 "failed": 2, "skipped": 0})
+        # the first batch came from the log
+        self.assertEqual(ArchiveHandler.requests, Counter({
+            "/metadata/superman_eleventh_hour": 1, "/metadata/odd_item": 1,
+            "/metadata/missing_item": 1}))
+
+
+if __name__ == "__main__":
+    unittest.main()